@@ -0,0 +1,235 @@
+"""Times mframe hot paths and records their peak memory.
+
+Run as: python benchmarks/bench.py [--rows 10000,100000] [--columns 2,10] [--cases filter,set]
+                                    [--output results.json] [--baseline baseline.json]
+
+Each case is timed without tracing, then run once more under tracemalloc for
+its peak memory. With --baseline the results are compared against an earlier
+--output file and the run exits with status 1 if a case got slower or bigger
+than --threshold allows.
+"""
+from __future__ import print_function
+import argparse
+import datetime as dt
+import gc
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from mframe import DataFrame  # noqa: E402
+
+ROWS = [10000, 100000, 1000000]
+COLUMNS = [2, 10, 50]
+KINDS = ['open', 'high', 'low', 'close']
+
+CASES = []
+
+
+def case(name, wide=True):
+    # wide cases run at every column count, the rest only need the fixed columns
+    def register(setup):
+        CASES.append((name, setup, wide))
+        return setup
+    return register
+
+
+def columns_data(rows, columns):
+    column = list(range(rows))
+    return dict(('col_{}'.format(i), column) for i in range(columns))
+
+
+def frame(rows, columns):
+    return DataFrame(columns_data(rows, columns))
+
+
+def mask(rows):
+    return [i % 2 == 0 for i in range(rows)]
+
+
+# Every case builds its inputs and returns the callable that is measured
+
+@case('init')
+def bench_init(rows, columns):
+    data = columns_data(rows, columns)
+    return lambda: DataFrame(data)
+
+
+@case('filter')
+def bench_filter(rows, columns):
+    df = frame(rows, columns)
+    selected = df.col_0 > rows // 2
+    return lambda: df[selected]
+
+
+@case('set')
+def bench_set(rows, columns):
+    df = frame(rows, columns)
+    selected = mask(rows)
+    return lambda: df.set(selected, 'col_0', -1)
+
+
+@case('drop')
+def bench_drop(rows, columns):
+    df = frame(rows, columns)
+    selected = mask(rows)
+    return lambda: df.drop(selected)
+
+
+@case('iterrows')
+def bench_iterrows(rows, columns):
+    df = frame(rows, columns)
+    return lambda: sum(row['col_0'] for row in df.iterrows())
+
+
+@case('iterrows_reuse')
+def bench_iterrows_reuse(rows, columns):
+    df = frame(rows, columns)
+    return lambda: sum(row['col_0'] for row in df.iterrows(reuse=True))
+
+
+@case('itertuples')
+def bench_itertuples(rows, columns):
+    df = frame(rows, columns)
+    return lambda: sum(row.col_0 for row in df.itertuples())
+
+
+@case('iterbatches')
+def bench_iterbatches(rows, columns):
+    df = frame(rows, columns)
+    return lambda: sum(sum(batch.col_0) for batch in df.iterbatches(10000))
+
+
+@case('pivot', wide=False)
+def bench_pivot(rows, columns):
+    df = DataFrame({
+        'key': [i // len(KINDS) for i in range(rows)],
+        'kind': [KINDS[i % len(KINDS)] for i in range(rows)],
+        'value': [float(i) for i in range(rows)],
+    })
+    return lambda: df.pivot('key', 'kind', 'value')
+
+
+@case('pivot_table', wide=False)
+def bench_pivot_table(rows, columns):
+    df = DataFrame({
+        'key': [i % 1000 for i in range(rows)],
+        'kind': [KINDS[i % len(KINDS)] for i in range(rows)],
+        'value': [float(i) for i in range(rows)],
+    })
+    return lambda: df.pivot_table(index=['key'], values=['value'], columns=['kind'], aggfunc='sum')
+
+
+@case('series_arithmetic', wide=False)
+def bench_series_arithmetic(rows, columns):
+    df = DataFrame({'a': list(range(rows)), 'b': [float(i) for i in range(rows)]})
+    return lambda: (df.a * 2 + df.b) / 3
+
+
+@case('datetime_compare', wide=False)
+def bench_datetime_compare(rows, columns):
+    start = dt.datetime(2019, 1, 1)
+    df = DataFrame({'date': [start + dt.timedelta(minutes=i) for i in range(rows)]})
+    return lambda: (df.date >= '2019-01-02') & (df.date < '2019-01-03 12:00:00')
+
+
+@case('rolling_mean', wide=False)
+def bench_rolling_mean(rows, columns):
+    df = DataFrame({'value': [float(i % 97) for i in range(rows)]})
+    return lambda: df.value.rolling(1000).mean()
+
+
+@case('rolling_time_max', wide=False)
+def bench_rolling_time_max(rows, columns):
+    start = dt.datetime(2019, 1, 1)
+    df = DataFrame({
+        'date': [start + dt.timedelta(seconds=10*i) for i in range(rows)],
+        'value': [float(i % 97) for i in range(rows)],
+    })
+    return lambda: df.value.rolling('5min', on=df.date).max()
+
+
+def measure(setup, rows, columns, repeat):
+    best = None
+    for _ in range(repeat):
+        fn = setup(rows, columns) # Cases may mutate their inputs, so set up each run
+        gc.collect()
+        start = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    fn = setup(rows, columns)
+    gc.collect()
+    tracemalloc.start()
+    try:
+        fn()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {'seconds': best, 'peak_bytes': peak}
+
+
+def run(cases, rows, columns, repeat):
+    results = {}
+    for name, setup, wide in CASES:
+        if cases and name not in cases:
+            continue
+        for n in rows:
+            for width in (columns if wide else [None]):
+                key = '{}/{}/{}'.format(name, n, width if wide else '-')
+                results[key] = result = measure(setup, n, width, repeat)
+                print('{:<40} {:>10.4f}s {:>10.1f}MB'.format(key, result['seconds'], result['peak_bytes'] / 1e6))
+                sys.stdout.flush()
+    return results
+
+
+def compare(results, baseline, threshold):
+    regressions = []
+    for key, result in sorted(results.items()):
+        before = baseline.get(key)
+        if before is None:
+            continue
+        for metric in ('seconds', 'peak_bytes'):
+            # Ignore noise on measurements too small to matter
+            floor = 0.001 if metric == 'seconds' else 1024
+            if result[metric] > max(before[metric], floor) * threshold:
+                regressions.append('{} {}: {:.4g} -> {:.4g}'.format(key, metric, before[metric], result[metric]))
+    return regressions
+
+
+def ints(value):
+    return [int(v) for v in value.split(',')]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark mframe hot paths')
+    parser.add_argument('--rows', type=ints, default=ROWS)
+    parser.add_argument('--columns', type=ints, default=COLUMNS)
+    parser.add_argument('--cases', type=lambda value: value.split(','), default=None)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output', help='write results as JSON')
+    parser.add_argument('--baseline', help='JSON results to compare against')
+    parser.add_argument('--threshold', type=float, default=1.25,
+                        help='flag cases slower or bigger than baseline times this')
+    args = parser.parse_args(argv)
+
+    results = run(args.cases, args.rows, args.columns, args.repeat)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'python': platform.python_version(), 'results': results}, f, indent=2, sort_keys=True)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['results']
+        regressions = compare(results, baseline, args.threshold)
+        for regression in regressions:
+            print('REGRESSION', regression)
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
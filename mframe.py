@@ -1,6 +1,21 @@
+import csv
 import operator
+import os
+import pickle
+from collections import deque, namedtuple
+from functools import partial
+import re
+import struct
+import sys
+import threading
+import time
 import types
+import warnings
+from itertools import chain, compress, islice
 import datetime as dt
+import json
+import math
+from array import array
 
 
 IS_JYTHON = False
@@ -10,84 +25,831 @@ try:
 except ImportError:
     pass
 
+try:
+    _INT_TYPES = (int, long)
+    _STRING_TYPES = (basestring,)
+except NameError: # Python 3
+    _INT_TYPES = (int,)
+    _STRING_TYPES = (str,)
 
-def parse_date(sdt):
-    if isinstance(sdt, dt.datetime):
-        return sdt
-    if IS_JYTHON and isinstance(sdt, JavaDate):
-        return dt.datetime.fromtimestamp(sdt.getTime()/1000)
-
-    # Limited support to guess datetime formats
-    patterns = [
-        '%Y-%m-%d', '%Y-%d-%m', '%d-%m-%Y',
-        '%Y-%m-%d %H:%M:%S',
-        # ISO 8601, offset (%z) not supported in Jython :(
-        '%Y-%m-%dT%H:%M:%S',
-        '%Y-%m-%dT%H:%M:%SZ',
-        '%Y%m%dT%H%M%SZ',
-    ]
-    for pattern in patterns:
-        try:
-            return dt.datetime.strptime(sdt, pattern)
-        except:
-            pass
+try:
+    from itertools import izip as _izip
+except ImportError: # Python 3
+    _izip = zip
+
+try:
+    from concurrent import futures
+except ImportError: # Python 2 without the futures backport, Jython
+    futures = None
+
+try:
+    import numpy
+except ImportError: # Optional, Jython always runs the pure Python loops
+    numpy = None
+
+try:
+    array('q')
+    _INT64 = 'q'
+except ValueError: # Python 2 has no long long arrays, long is 64 bit on Linux and Jython
+    _INT64 = 'l'
+
+
+# Limited support to guess datetime formats
+_DATE_PATTERNS = [
+    '%Y-%m-%d', '%Y-%d-%m', '%d-%m-%Y',
+    '%Y-%m-%d %H:%M:%S',
+    # ISO 8601, offset (%z) not supported in Jython :(
+    '%Y-%m-%dT%H:%M:%S',
+    '%Y-%m-%dT%H:%M:%SZ',
+    '%Y%m%dT%H%M%SZ',
+]
+# Can also match strings an earlier pattern wins on, so it is never reused
+_SHADOWED_PATTERNS = set(['%Y-%d-%m'])
+
+# Fast path for the zero padded ISO 8601 forms of the patterns above
+_ISO = 'iso'
+_ISO_DATETIME = re.compile(
+    r'([0-9]{4})-([0-9]{2})-([0-9]{2})(?:( |T)([0-9]{2}):([0-9]{2}):([0-9]{2})(Z?))?$'
+)
+
+_DATE_CACHE = {}
+_DATE_CACHE_SIZE = 4096
+
+
+def _parse_iso(sdt):
+    match = _ISO_DATETIME.match(sdt)
+    if match is None:
+        return None
+    year, month, day, sep, hour, minute, second, zulu = match.groups()
+    if sep == ' ' and zulu:
+        return None
+    try:
+        if sep is None:
+            return dt.datetime(int(year), int(month), int(day))
+        return dt.datetime(int(year), int(month), int(day), int(hour), int(minute), int(second))
+    except ValueError: # e.g. day first dates such as 2019-26-06
+        return None
+
+
+def _parse_with(sdt, pattern):
+    if pattern is _ISO:
+        return _parse_iso(sdt)
+    try:
+        return dt.datetime.strptime(sdt, pattern)
+    except ValueError:
+        return None
+
+
+def _sniff(sdt):
+    for pattern in [_ISO] + _DATE_PATTERNS:
+        value = _parse_with(sdt, pattern)
+        if value is not None:
+            return pattern, value
     raise TypeError("{} is not a recognized datetime format".format(sdt))
 
 
-class Series:
+# Naive datetimes are stored as integer microseconds since the epoch,
+# missing ones as the int64 minimum which NumPy also reads as NaT
+_EPOCH = dt.datetime(1970, 1, 1)
+_NAT = -2**63
+
+
+def _to_epoch(value):
+    delta = value - _EPOCH
+    return (delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds
+
+
+def _from_epoch(value):
+    return _EPOCH + dt.timedelta(microseconds=value)
+
+
+def _java_to_epoch(sdt):
+    # Local wall clock time, matching the naive datetimes it is compared with
+    return (sdt.getTime() - sdt.getTimezoneOffset() * 60000) * 1000
+
+
+def _from_java_date(sdt):
+    return _from_epoch(_java_to_epoch(sdt))
+
+
+def _epoch(value):
+    if value is None:
+        return _NAT
+    if IS_JYTHON and isinstance(value, JavaDate):
+        return _java_to_epoch(value)
+    if value.tzinfo is not None:
+        raise TypeError('Timezone aware datetimes are not stored as epochs')
+    return _to_epoch(value)
+
+
+def _decode_epoch(value):
+    return None if value == _NAT else _from_epoch(value)
+
+
+def parse_dates(values):
+    # The pattern that matched the previous string is tried first, so a
+    # column in a single format costs one parse per distinct value.
+    pattern = None
+    cache = _DATE_CACHE
+    parsed = []
+    for sdt in values:
+        if isinstance(sdt, dt.datetime):
+            parsed.append(sdt)
+            continue
+        if IS_JYTHON and isinstance(sdt, JavaDate):
+            parsed.append(_from_java_date(sdt))
+            continue
+        if not isinstance(sdt, _STRING_TYPES):
+            raise TypeError("{} is not a recognized datetime format".format(sdt))
+        value = cache.get(sdt)
+        if value is None:
+            if pattern is not None:
+                value = _parse_with(sdt, pattern)
+            if value is None:
+                pattern, value = _sniff(sdt)
+                if pattern in _SHADOWED_PATTERNS:
+                    pattern = None
+            if len(cache) >= _DATE_CACHE_SIZE:
+                cache.clear()
+            cache[sdt] = value
+        parsed.append(value)
+    return parsed
+
+
+def parse_date(sdt):
+    return parse_dates([sdt])[0]
+
+
+_MISSING = object()
+
+
+def _first(acc, value):
+    return value if acc is _MISSING else acc
+
+
+def _last(acc, value):
+    return value
+
+
+def _sum(acc, value):
+    return value if acc is _MISSING else acc + value
+
+
+def _count(acc, value):
+    return 1 if acc is _MISSING else acc + 1
+
+
+def _min(acc, value):
+    return value if acc is _MISSING or value < acc else acc
+
+
+def _max(acc, value):
+    return value if acc is _MISSING or value > acc else acc
+
+
+def _mean(acc, value):
+    return (value, 1) if acc is _MISSING else (acc[0] + value, acc[1] + 1)
+
+
+def _collect(acc, value):
+    if acc is _MISSING:
+        return [value]
+    acc.append(value)
+    return acc
+
+
+def _identity(acc):
+    return acc
+
+
+# Streaming reducers as (step, final) pairs, the accumulator starts as _MISSING
+_AGGREGATORS = {
+    'first': (_first, _identity),
+    'last': (_last, _identity),
+    'sum': (_sum, _identity),
+    'count': (_count, _identity),
+    'min': (_min, _identity),
+    'max': (_max, _identity),
+    'mean': (_mean, lambda acc: acc[0] / float(acc[1])),
+}
+
+
+def _aggregator(aggfunc):
+    if callable(aggfunc):
+        return _collect, aggfunc
+    try:
+        return _AGGREGATORS[aggfunc]
+    except KeyError:
+        raise ValueError('{} is not a supported aggregation'.format(aggfunc))
+
+
+def _factorize(key_columns):
+    # Hash each key combination to a group number, keeping first seen order.
+    # Categorical keys are hashed on their codes and decoded once per group.
+    tables = []
+    key_columns = list(key_columns)
+    for i, column in enumerate(key_columns):
+        data = column.data if isinstance(column, Series) else column
+        if isinstance(data, _Codes):
+            key_columns[i] = data.codes
+            tables.append(data.table)
+        else:
+            tables.append(None)
+    groups = {}
+    group_ids = []
+    for key in zip(*key_columns):
+        group = groups.get(key)
+        if group is None:
+            group = groups[key] = len(groups)
+        group_ids.append(group)
+    keys = [None]*len(groups)
+    for key, group in groups.items():
+        keys[group] = key
+    if any(table is not None for table in tables):
+        keys = [tuple(v if table is None else table[v] for table, v in zip(tables, key)) for key in keys]
+    return group_ids, keys
+
+
+class _Codes(object):
+    # A dictionary encoded column, integer codes into a table of categories.
+    # Missing values are code -1, which indexes the None kept at the end of
+    # the table. Items decode on access so it reads like a list of values.
+    # Codes are single bytes until there are more than 127 categories.
+    __slots__ = ['codes', 'table']
+
+    def __init__(self, codes, table):
+        self.codes = codes
+        self.table = table
+
+    @property
+    def categories(self):
+        return self.table[:-1]
+
+    def lookup(self):
+        return dict((value, code) for code, value in enumerate(self.table[:-1]))
+
+    def code(self, value, lookup=None):
+        # The code for value, adding it to the categories when it is new
+        if value is None:
+            return -1
+        lookup = self.lookup() if lookup is None else lookup
+        code = lookup.get(value)
+        if code is None:
+            code = lookup[value] = len(self.table) - 1
+            self.table.insert(code, value)
+            if code > 127 and self.codes.typecode == 'b':
+                self.codes = array('i', self.codes)
+        return code
+
+    def matches(self, codes):
+        # One flag per row, set where the code is one of codes
+        if self.codes.typecode == 'b':
+            table = bytearray(256)
+            for code in codes:
+                if -128 <= code < 128:
+                    table[code & 0xFF] = 1
+            return bytearray(_tobytes(self.codes)).translate(bytes(table))
+        return map(set(codes).__contains__, self.codes)
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return _Codes(self.codes[idx], list(self.table))
+        return self.table[self.codes[idx]]
+
+    def __iter__(self):
+        return iter(map(self.table.__getitem__, self.codes))
+
+    def __reduce__(self):
+        return _Codes, (self.codes, self.table)
+
+
+def _categorize(values):
+    codes = _Codes(array('b'), [None])
+    lookup = {}
+    code = codes.code
+    encoded = [code(value, lookup) for value in values]
+    codes.codes.extend(encoded) # After encoding, the typecode depends on the number of categories
+    return codes
+
+
+# Numeric columns are stored in compact arrays, categories as _Codes, everything else in lists
+_TYPECODES = {'int64': _INT64, 'float64': 'd', 'bool': 'b', 'datetime': _INT64}
+_ARRAY_DTYPES = {_INT64: 'int64', 'd': 'float64', 'b': 'bool'}
+_NUMERIC = ('int64', 'float64', 'bool')
+
+
+def _infer_dtype(values):
+    # Epoch datetime arrays can't be told apart from int64, callers pass their dtype
+    if isinstance(values, array):
+        return _ARRAY_DTYPES.get(values.typecode, 'object')
+    if isinstance(values, _Codes):
+        return 'category'
+    if len(values) == 0:
+        return 'object'
+    first = next((value for value in values if value is not None), None)
+    if isinstance(first, dt.datetime) or (IS_JYTHON and isinstance(first, JavaDate)):
+        return 'datetime'
+    kinds = set(map(type, values))
+    if kinds == set([bool]):
+        return 'bool'
+    if kinds == set([float]):
+        return 'float64'
+    if kinds.issubset(_INT_TYPES):
+        return 'int64'
+    return 'object'
+
+
+def _as_storage(values, dtype=None):
+    if isinstance(values, Series):
+        return values.data, values.dtype
+    if not isinstance(values, (list, array, _Codes)):
+        values = list(values)
+    if dtype is None:
+        dtype = _infer_dtype(values)
+    if dtype == 'category':
+        return (values if isinstance(values, _Codes) else _categorize(values)), dtype
+    if isinstance(values, _Codes):
+        values = list(values)
+    typecode = _TYPECODES.get(dtype)
+    if typecode is None:
+        return (values if isinstance(values, list) else list(values)), dtype
+    if isinstance(values, array) and values.typecode == typecode:
+        return values, dtype
+    if dtype == 'datetime':
+        try:
+            return array(typecode, [_epoch(v) for v in values]), dtype
+        except (TypeError, AttributeError, OverflowError):
+            # Timezone aware dates are kept as they are
+            return list(values), dtype
+    try:
+        return array(typecode, values), dtype
+    except (TypeError, OverflowError):
+        # Wrong guess or out of int64 range, fall back to the data itself
+        if dtype != _infer_dtype(values):
+            return _as_storage(values)
+        return list(values), 'object'
+
+
+def _decoder(data, dtype):
+    if dtype == 'bool':
+        return bool
+    if dtype == 'datetime' and isinstance(data, array):
+        return _decode_epoch
+    return None
+
+
+def _decode(data, dtype):
+    fn = _decoder(data, dtype)
+    if fn is None:
+        return data
+    return [fn(value) for value in data]
+
+
+def _tolist(data, dtype):
+    decoded = _decode(data, dtype)
+    if decoded is not data:
+        return decoded
+    if isinstance(data, array):
+        return data.tolist()
+    return list(data)
+
+
+def _tobytes(values):
+    return values.tobytes() if hasattr(values, 'tobytes') else values.tostring()
+
+
+def _frombytes(typecode, data):
+    values = array(typecode)
+    if hasattr(values, 'frombytes'):
+        values.frombytes(data)
+    else: # Python 2
+        values.fromstring(data.tobytes() if hasattr(data, 'tobytes') else bytes(data))
+    return values
+
+
+def _gather(values, positions):
+    if isinstance(values, _Codes):
+        return _Codes(_gather(values.codes, positions), list(values.table))
+    taken = [values[i] for i in positions]
+    if isinstance(values, array):
+        return array(values.typecode, taken)
+    return taken
+
+
+def _compact(values, removed):
+    # Close the gaps left by the sorted removed positions in place,
+    # moving each run of surviving rows with one slice assignment.
+    if isinstance(values, _Codes):
+        values = values.codes
+    write = removed[0]
+    for k, start in enumerate(removed):
+        start += 1
+        end = removed[k + 1] if k + 1 < len(removed) else len(values)
+        if end > start:
+            values[write:write + end - start] = values[start:end]
+            write += end - start
+    del values[write:]
+
+
+_BATCH_ROWS = 256 # Rows transposed at once, small enough to stay in cache
+
+
+def _transpose_into(columns, rows):
+    # Transpose a small batch at a time rather than appending cell by cell
+    for values, more in zip(columns, zip(*rows)):
+        values.extend(more)
+
+
+def _rows_to_columns(rows, width):
+    columns = [[] for _ in range(width)]
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, _BATCH_ROWS))
+        if not batch:
+            return columns
+        if min(map(len, batch)) < width:
+            raise ValueError('Expected rows with {} values'.format(width))
+        _transpose_into(columns, batch)
+
+
+def _sortable(data, dtype):
+    # Missing datetimes sort last like None, their epoch sentinel would sort first
+    if dtype == 'datetime' and isinstance(data, array) and _NAT in data:
+        return [None if value == _NAT else value for value in data]
+    return data
+
+
+def _argsort(data, ascending=True, order=None):
+    # Stable sort of row positions by data, missing values (None, NaN) go last
+    if order is None:
+        order = list(range(len(data)))
+    nullable = not isinstance(data, array) or data.typecode == 'd'
+    if nullable and any(value is None or value != value for value in data):
+        nulls = set(i for i, value in enumerate(data) if value is None or value != value)
+        if ascending:
+            key = lambda i: (True, 0) if i in nulls else (False, data[i])
+        else:
+            key = lambda i: (False, 0) if i in nulls else (True, data[i])
+        order.sort(key=key, reverse=not ascending)
+    else:
+        order.sort(key=data.__getitem__, reverse=not ascending)
+    return order
+
+
+def _hash_join(left_keys, right_keys, how):
+    # Hash the smaller side's keys and probe them with the larger side,
+    # returning matching (left, right) row positions in left row order.
+    # Positions are None where a row has no partner.
+    left_pos, right_pos, unmatched = [], [], []
+    if len(right_keys) <= len(left_keys):
+        table = {}
+        for j, key in enumerate(right_keys):
+            bucket = table.get(key)
+            if bucket is None:
+                table[key] = [j]
+            else:
+                bucket.append(j)
+        matched = set()
+        for i, key in enumerate(left_keys):
+            bucket = table.get(key)
+            if bucket is None:
+                if how != 'inner':
+                    left_pos.append(i)
+                    right_pos.append(None)
+                continue
+            for j in bucket:
+                left_pos.append(i)
+                right_pos.append(j)
+            if how == 'outer':
+                matched.update(bucket)
+        if how == 'outer':
+            unmatched = [j for j in range(len(right_keys)) if j not in matched]
+    else:
+        table = {}
+        for i, key in enumerate(left_keys):
+            bucket = table.get(key)
+            if bucket is None:
+                table[key] = [i]
+            else:
+                bucket.append(i)
+        pairs = []
+        for j, key in enumerate(right_keys):
+            bucket = table.get(key)
+            if bucket is None:
+                if how == 'outer':
+                    unmatched.append(j)
+                continue
+            for i in bucket:
+                pairs.append((i, j))
+        if how != 'inner':
+            matched = set(i for i, _ in pairs)
+            pairs.extend((i, None) for i in range(len(left_keys)) if i not in matched)
+        pairs.sort(key=operator.itemgetter(0)) # Stable, so right rows keep their order
+        left_pos = [i for i, _ in pairs]
+        right_pos = [j for _, j in pairs]
+    left_pos.extend([None]*len(unmatched))
+    right_pos.extend(unmatched)
+    return left_pos, right_pos
+
+
+def _fits(dtype, value):
+    # Whether value can be stored in an array column of dtype as it is
+    if dtype == 'datetime':
+        return value is None or (isinstance(value, dt.datetime) and value.tzinfo is None)
+    return _scalar_dtype(value) == dtype
+
+
+def _scalar_dtype(value):
+    if isinstance(value, bool):
+        return 'bool'
+    if isinstance(value, float):
+        return 'float64'
+    if isinstance(value, _INT_TYPES):
+        return 'int64'
+    return 'object'
+
+
+def _arithmetic_dtype(op, left, right):
+    if left not in _NUMERIC or right not in _NUMERIC:
+        return None # Let the result decide
+    if op is operator.truediv or 'float64' in (left, right):
+        return 'float64'
+    return 'int64'
+
+
+_EXACT_FLOAT = 2**53 # Larger integers don't all survive conversion to float
+_INT64_LIMIT = 2**63
+
+
+class _Backend(object):
+    # Vectorised kernels for numeric array columns. Every kernel returns None
+    # when it can't give exactly what the pure Python loop would, e.g. int64
+    # overflow, division by zero or NaN ordering, and the caller loops instead.
+    # NumPy is used when it can be imported unless MFRAME_BACKEND=python.
+    # A bad MFRAME_BACKEND only warns, importing mframe shouldn't fail over it.
+    def __init__(self):
+        self.name = 'python'
+        try:
+            self.use(os.environ.get('MFRAME_BACKEND') or None)
+        except (ValueError, ImportError) as e:
+            warnings.warn('Ignoring MFRAME_BACKEND, using the python backend: {}'.format(e))
+
+    def use(self, name=None):
+        if name is None:
+            name = 'python' if numpy is None else 'numpy'
+        if name not in ('numpy', 'python'):
+            raise ValueError('Unknown backend {}'.format(name))
+        if name == 'numpy' and numpy is None:
+            raise ImportError('The numpy backend needs NumPy installed')
+        self.name = name
+
+    def _array(self, data, dtype):
+        # A view on the column buffer, bools widened so they add up like ints.
+        # Views are dropped before returning, arrays can't resize while exported.
+        if self.name != 'numpy' or dtype not in _NUMERIC or not isinstance(data, array):
+            return None
+        values = numpy.asarray(data)
+        return values.astype('int64') if dtype == 'bool' else values
+
+    def _scalar(self, value):
+        dtype = _scalar_dtype(value)
+        if dtype == 'float64':
+            return numpy.array(value, 'float64')
+        if dtype in ('int64', 'bool') and -_INT64_LIMIT <= value < _INT64_LIMIT:
+            return numpy.array(value, 'int64')
+        return None
+
+    def _result(self, values):
+        if values.dtype.kind == 'f':
+            return _frombytes('d', values.astype('float64', copy=False).view('uint8')), 'float64'
+        return _frombytes(_INT64, values.astype('int64', copy=False).view('uint8')), 'int64'
+
+    def arithmetic(self, op, left, right, reverse=False):
+        x = self._array(left.data, left.dtype)
+        if x is None:
+            return None
+        if isinstance(right, Series):
+            y = self._array(right.data, right.dtype) if len(right) == len(left) else None
+        elif isinstance(right, _SEQUENCES):
+            return None
+        else:
+            y = self._scalar(right)
+        if y is None:
+            return None
+        if reverse:
+            x, y = y, x
+        ints = x.dtype.kind == 'i' and y.dtype.kind == 'i'
+        if op is operator.truediv:
+            if (y == 0).any():
+                return None # Python raises ZeroDivisionError
+            if ints and max(_magnitude(x), _magnitude(y)) > _EXACT_FLOAT:
+                return None # Python divides big ints exactly
+        elif ints:
+            bound = _magnitude(x) * _magnitude(y) if op is operator.mul else _magnitude(x) + _magnitude(y)
+            if bound >= _INT64_LIMIT:
+                return None # Python ints don't overflow
+        with numpy.errstate(all='ignore'):
+            return self._result(op(x, y))
+
+    def compare(self, op, data, dtype, other):
+        x = self._array(data, 'int64' if dtype == 'datetime' else dtype)
+        if x is None:
+            return None
+        y = self._scalar(other)
+        if y is None:
+            return None
+        # Python compares ints and floats exactly, NumPy converts the int to float
+        if x.dtype.kind == 'i' and y.dtype.kind == 'f':
+            if numpy.isfinite(y) and _magnitude(x) > _EXACT_FLOAT:
+                return None
+        elif x.dtype.kind == 'f' and y.dtype.kind == 'i':
+            if abs(other) > _EXACT_FLOAT:
+                return None
+        flags = op(x, y)
+        if dtype == 'datetime':
+            flags[x == _NAT] = op is operator.ne
+        return flags.view('uint8')
+
+    def absolute(self, data, dtype):
+        x = self._array(data, dtype)
+        if x is None or dtype == 'bool' or (x.dtype.kind == 'i' and len(x) and x.min() == -_INT64_LIMIT):
+            return None
+        return self._result(numpy.abs(x))
+
+    def round(self, data, dtype, ndigits):
+        # round(x, 0) rounds half to even like rint, other digits use
+        # Python's correctly rounded algorithm which NumPy doesn't match
+        x = self._array(data, dtype)
+        if x is None or dtype == 'bool' or sys.version_info[0] < 3:
+            return None
+        if x.dtype.kind == 'i':
+            return (data[:], dtype) if ndigits >= 0 else None
+        return self._result(numpy.rint(x)) if ndigits == 0 else None
+
+    def reduce(self, fn, data, dtype):
+        # Index the first extreme like min and max do, so ties keep their sign
+        if fn not in (min, max):
+            return None
+        x = self._array(data, 'int64' if dtype == 'datetime' else dtype)
+        if x is None or len(x) == 0 or (x.dtype.kind == 'f' and numpy.isnan(x).any()):
+            return None
+        return data[int(numpy.argmin(x) if fn is min else numpy.argmax(x))]
+
+
+def _magnitude(values):
+    # Largest absolute value as a Python int, abs() of the int64 minimum overflows in NumPy
+    if values.size == 0:
+        return 0
+    return max(abs(int(values.min())), abs(int(values.max())))
+
+
+backend = _Backend()
+
+
+class Series(object):
     __slots__ = ['data', 'dtype']
 
     def __init__(self, data):
-        self.data = data
-        self.dtype = self._dtype()
+        self.data, self.dtype = _as_storage(data)
 
-    def _dtype(self):
-        if len(self) > 0:
-            if isinstance(self.data[0], dt.datetime) or (IS_JYTHON and isinstance(self.data[0], JavaDate)):
-                return 'datetime'
-        return 'object'
+    @classmethod
+    def _wrap(cls, data, dtype):
+        series = cls.__new__(cls)
+        series.data = data
+        series.dtype = dtype
+        return series
+
+    @classmethod
+    def _from_values(cls, values, dtype=None):
+        return cls._wrap(*_as_storage(values, dtype))
 
     def __iter__(self):
-        return iter(self.data)
+        return iter(_decode(self.data, self.dtype))
+
+    def tolist(self):
+        return _tolist(self.data, self.dtype)
 
     def _dt_conversion(self, other):
-        if isinstance(other, (list, Series)):
-            return [parse_date(o) for o in other]
+        if isinstance(other, _SEQUENCES):
+            return parse_dates(other)
         else:
             return parse_date(other)
 
     def _compare(self, other, op):
+        if self.dtype == 'category' and op in (operator.eq, operator.ne) and not isinstance(other, _SEQUENCES):
+            # Compare integer codes, a value that isn't a category matches nothing
+            code = -1 if other is None else self.data.lookup().get(other, -2)
+            mask = Mask._from_flags(self.data.matches([code]))
+            return mask if op is operator.eq else ~mask
+        if self.dtype == 'datetime' and isinstance(self.data, array) and not isinstance(other, _SEQUENCES):
+            # Compare epoch integers, the operand is converted once
+            if IS_JYTHON and isinstance(other, JavaDate):
+                other = _java_to_epoch(other)
+            else:
+                other = _to_epoch(parse_date(other))
+            flags = backend.compare(op, self.data, self.dtype, other)
+            if flags is None:
+                # Missing dates match nothing, they only differ from everything
+                missing = op is operator.ne
+                flags = [missing if data == _NAT else op(data, other) for data in self.data]
+            return Mask._from_flags(flags)
         if self.dtype == 'datetime':
             other = self._dt_conversion(other)
-        if isinstance(other, (list, Series)):
-            return op(self.data, other)
-        else:
-            return Series([op(data, other) for data in self.data])
+        if isinstance(other, _SEQUENCES):
+            return op(self.tolist(), list(other))
+        flags = backend.compare(op, self.data, self.dtype, other)
+        if flags is None:
+            flags = [op(data, other) for data in self]
+        return Mask._from_flags(flags)
 
     def _operator_apply(self, other, op_, reverse=False):
+        result = backend.arithmetic(op_, self, other, reverse)
+        if result is not None:
+            return Series._wrap(*result)
         if reverse:
             op = lambda x, y: op_(y, x)
         else:
             op = op_
 
-        _values = []
-        if isinstance(other, (list, Series)):
-            for s, o in zip(self.data, other):
-                _values.append(op(s, o))
+        if isinstance(other, _SEQUENCES):
+            other_dtype = other.dtype if isinstance(other, Series) else None
+            _values = [op(s, o) for s, o in zip(self, other)]
         else:
-            _values = [op(s, other) for s in self.data]
-        return Series(_values)
+            other_dtype = _scalar_dtype(other)
+            _values = [op(s, other) for s in self]
+        return Series._from_values(_values, _arithmetic_dtype(op_, self.dtype, other_dtype))
+
+    def isin(self, values):
+        if self.dtype == 'category':
+            lookup = self.data.lookup()
+            codes = set(-1 if value is None else lookup.get(value, -2) for value in values)
+            return Mask._from_flags(self.data.matches(codes))
+        values = set(values)
+        return Mask._from_flags([value in values for value in self])
+
+    def astype(self, dtype):
+        if dtype == self.dtype:
+            return Series._wrap(self.data, self.dtype)
+        return Series._from_values(self.tolist(), dtype)
 
     def apply(self, fn):
-        self.data = [fn(value) for value in self.data]
-        return Series(self.data)
+        self.data, self.dtype = _as_storage([fn(value) for value in self])
+        return Series._wrap(self.data, self.dtype)
+
+    def _reduce(self, fn):
+        data = self.data
+        if self.dtype == 'datetime' and isinstance(data, array) and _NAT in data:
+            data = array(data.typecode, [value for value in data if value != _NAT])
+        if len(data) == 0:
+            return None
+        value = backend.reduce(fn, data, self.dtype)
+        if value is None:
+            value = fn(data)
+        decode = _decoder(data, self.dtype)
+        return value if decode is None else decode(value)
+
+    def argsort(self, ascending=True):
+        return Series._wrap(array(_INT64, _argsort(_sortable(self.data, self.dtype), ascending)), 'int64')
+
+    def sort_values(self, ascending=True):
+        return Series._wrap(_gather(self.data, _argsort(_sortable(self.data, self.dtype), ascending)), self.dtype)
+
+    def parallel_apply(self, fn, n_workers=None, executor='process'):
+        # fn has to be picklable for the process pool, use executor='thread' for lambdas
+        n_workers = _workers(n_workers)
+        payloads = [(self.data[start:stop], self.dtype) for start, stop in _partitions(len(self), n_workers)]
+        results = _run_partitions(partial(_apply_partition, fn), payloads, n_workers, executor)
+        return Series._from_values(list(chain.from_iterable(results)))
+
+    def rolling(self, window, min_periods=None, on=None):
+        # window is a row count, or a duration such as '5min' over the sorted datetimes in on
+        return Rolling(self, window, min_periods, on)
+
+    def expanding(self, min_periods=1):
+        return Rolling(self, None, min_periods)
+
+    def min(self):
+        return self._reduce(min)
+
+    def max(self):
+        return self._reduce(max)
 
     def __getitem__(self, idx):
-        return self.data[idx]
+        if isinstance(idx, slice):
+            return _tolist(self.data[idx], self.dtype)
+        value = self.data[idx]
+        fn = _decoder(self.data, self.dtype)
+        return value if fn is None else fn(value)
 
     def __eq__(self, other):
         return self._compare(other, operator.eq)
 
+    def __ne__(self, other):
+        return self._compare(other, operator.ne)
+
     def __ge__(self, other):
         return self._compare(other, operator.ge)
 
@@ -101,7 +863,16 @@ class Series:
         return self._compare(other, operator.lt)
 
     def __and__(self, other):
-        return Series([all([b1, b2]) for b1, b2 in zip(self.data, other)])
+        return _as_mask(self) & other
+
+    def __or__(self, other):
+        return _as_mask(self) | other
+
+    def __xor__(self, other):
+        return _as_mask(self) ^ other
+
+    def __invert__(self):
+        return ~_as_mask(self)
 
     def __add__(self, other):
         return self._operator_apply(other, operator.add)
@@ -134,28 +905,377 @@ class Series:
         return self._operator_apply(other, operator.add)
 
     def __round__(self, value):
-        self.data = [round(x, value) for x in self.data]
+        result = backend.round(self.data, self.dtype, value)
+        if result is None:
+            dtype = self.dtype if self.dtype in ('int64', 'float64') else None
+            result = _as_storage([round(x, value) for x in self], dtype)
+        self.data, self.dtype = result
         return self
 
     def __abs__(self):
-        _data = [abs(x) for x in self.data]
-        return Series(_data)
+        result = backend.absolute(self.data, self.dtype)
+        if result is not None:
+            return Series._wrap(*result)
+        dtype = self.dtype if self.dtype in ('int64', 'float64') else None
+        return Series._from_values([abs(x) for x in self], dtype)
 
     def __len__(self):
         return len(self.data)
 
     def __repr__(self):
-        return repr(self.data)
+        return repr(self.tolist())
 
     def __str__(self):
-        return str(self.data)
+        return str(self.tolist())
+
+
+# Translation tables between one byte per row flags and binary digits
+_FLAG_DIGITS = bytes(bytearray(b'0' + b'1'*255))
+_DIGIT_FLAGS = bytes(bytearray(48) + bytearray(b'\x00\x01') + bytearray(206))
+
+
+class Mask(Series):
+    # A boolean series stored as the bits of a Python int, bit i
+    # being row i, so &, |, ^ and ~ run a machine word at a time.
+    # Masks never change, the one byte per row flags are kept once built
+    # so indexing doesn't shift the whole int for every row.
+    __slots__ = ['bits', 'size', '_flag_bytes']
+
+    def __init__(self, values):
+        mask = Mask._from_flags(1 if value else 0 for value in values)
+        self.bits, self.size, self._flag_bytes = mask.bits, mask.size, mask._flag_bytes
+
+    @classmethod
+    def _from_bits(cls, bits, size):
+        mask = cls.__new__(cls)
+        mask.bits = bits
+        mask.size = size
+        mask._flag_bytes = None
+        return mask
+
+    @classmethod
+    def _from_flags(cls, flags):
+        flags = bytearray(flags)
+        if not flags:
+            return cls._from_bits(0, 0)
+        digits = flags[::-1].translate(_FLAG_DIGITS)
+        return cls._from_bits(int(digits.decode('ascii'), 2), len(flags))
+
+    def _flags(self):
+        if self._flag_bytes is None:
+            if not self.size:
+                return bytearray()
+            digits = bytearray(format(self.bits, '0{}b'.format(self.size)).encode('ascii'))
+            self._flag_bytes = digits[::-1].translate(_DIGIT_FLAGS)
+        return self._flag_bytes
+
+    def positions(self):
+        return list(compress(range(self.size), self._flags()))
+
+    @property
+    def dtype(self):
+        return 'bool'
+
+    @property
+    def data(self):
+        return array('b', self._flags())
+
+    def __iter__(self):
+        return iter(map(bool, self._flags()))
+
+    def tolist(self):
+        return list(self)
+
+    # apply and round rebind a series' data, which a mask can't hold,
+    # so they work on a plain bool series instead
+    def apply(self, fn):
+        return Series._wrap(self.data, 'bool').apply(fn)
+
+    def __round__(self, value):
+        return Series._wrap(self.data, 'bool').__round__(value)
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return self.tolist()[idx]
+        if idx < 0:
+            idx += self.size
+        if not 0 <= idx < self.size:
+            raise IndexError('mask index out of range')
+        return bool(self._flags()[idx])
+
+    def _full(self):
+        return (1 << self.size) - 1
+
+    def __and__(self, other):
+        return Mask._from_bits(self.bits & _as_mask(other).bits, self.size)
+
+    def __or__(self, other):
+        return Mask._from_bits((self.bits | _as_mask(other).bits) & self._full(), self.size)
+
+    def __xor__(self, other):
+        return Mask._from_bits((self.bits ^ _as_mask(other).bits) & self._full(), self.size)
+
+    def __invert__(self):
+        return Mask._from_bits(self.bits ^ self._full(), self.size)
+
+    __rand__ = __and__
+    __ror__ = __or__
+    __rxor__ = __xor__
+
+    def sum(self):
+        return bin(self.bits).count('1')
+
+    def any(self):
+        return self.bits != 0
+
+    def all(self):
+        return self.bits == self._full()
+
+
+def _as_mask(values):
+    if isinstance(values, Mask):
+        return values
+    return Mask._from_flags(map(bool, values))
+
+
+_SEQUENCES = (list, array, Series)
+
+
+def _partitions(length, parts):
+    # Contiguous (start, stop) row ranges, as even as possible
+    size, extra = divmod(length, parts)
+    bounds, start = [], 0
+    for i in range(parts):
+        stop = start + size + (1 if i < extra else 0)
+        if stop > start:
+            bounds.append((start, stop))
+        start = stop
+    return bounds
+
+
+def _workers(n_workers):
+    if n_workers:
+        return n_workers
+    try:
+        import multiprocessing
+        return multiprocessing.cpu_count()
+    except (ImportError, NotImplementedError):
+        return 1
+
+
+def _run_partitions(task, payloads, n_workers, executor):
+    # Maps task over the payloads in a pool keeping their order, or
+    # serially where there is no pool to be had.
+    if executor not in ('process', 'thread'):
+        raise ValueError('{} is not a supported executor'.format(executor))
+    if futures is not None and n_workers > 1 and len(payloads) > 1:
+        pool_class = futures.ThreadPoolExecutor if executor == 'thread' else futures.ProcessPoolExecutor
+        try:
+            pool = pool_class(max_workers=n_workers)
+        except (ImportError, NotImplementedError, OSError): # No working multiprocessing
+            pool = None
+        if pool is not None:
+            with pool:
+                return list(pool.map(task, payloads))
+    return [task(payload) for payload in payloads]
+
+
+# Partitions travel to and from workers as column storage, not frames or rows
+
+def _apply_partition(fn, payload):
+    data, dtype = payload
+    return [fn(value) for value in _decode(data, dtype)]
+
+
+def _frame_partition(fn, payload):
+    columns, values, dtypes = payload
+    result = fn(DataFrame._new(list(columns), list(values), list(dtypes)))
+    if isinstance(result, DataFrame):
+        return 'frame', result._columns, [result._column(idx) for idx in range(len(result._values))], result._dtypes
+    if isinstance(result, Series):
+        return 'series', result.data, result.dtype
+    return 'value', result
+
+
+def _concat_storage(parts):
+    dtypes = set(dtype for _, dtype in parts)
+    first = parts[0][0]
+    if len(dtypes) == 1 and isinstance(first, array):
+        if all(isinstance(data, array) and data.typecode == first.typecode for data, _ in parts):
+            data = array(first.typecode)
+            for more, _ in parts:
+                data.extend(more)
+            return data, parts[0][1]
+    if len(dtypes) == 1 and all(isinstance(data, list) for data, _ in parts):
+        return list(chain.from_iterable(data for data, _ in parts)), parts[0][1]
+    values = []
+    for data, dtype in parts:
+        values.extend(_tolist(data, dtype))
+    return _as_storage(values, 'category' if dtypes == set(['category']) else None)
+
+
+def _concat_results(results):
+    kinds = set(result[0] for result in results)
+    if kinds == set(['frame']):
+        columns = list(results[0][1])
+        _values, dtypes = [], []
+        for column in columns:
+            parts = []
+            for _, names, values, part_dtypes in results:
+                idx = names.index(column)
+                parts.append((values[idx], part_dtypes[idx]))
+            values, dtype = _concat_storage(parts)
+            _values.append(values)
+            dtypes.append(dtype)
+        return DataFrame._new(columns, _values, dtypes)
+    if kinds == set(['series']):
+        return Series._wrap(*_concat_storage([(data, dtype) for _, data, dtype in results]))
+    values = [result[1] for result in results]
+    if all(isinstance(value, list) for value in values):
+        return list(chain.from_iterable(values))
+    return values
+
+
+class _Selection(object):
+    # A column that has not been copied yet, rows are looked up
+    # in the parent column through a selection vector of positions.
+    __slots__ = ['values', 'positions']
+
+    def __init__(self, values, positions):
+        self.values = values
+        self.positions = positions
+
+    def materialize(self):
+        return _gather(self.values, self.positions)
+
+    def __len__(self):
+        return len(self.positions)
+
+
+class _RowView(object):
+    # Dict-like access to one row, see DataFrame.iterrows(reuse=True)
+    __slots__ = ['_positions', '_columns', '_values', '_row']
+
+    def __init__(self, columns, values):
+        self._positions = dict((column, idx) for idx, column in enumerate(columns))
+        self._columns = columns
+        self._values = values
+        self._row = 0
+
+    def __getitem__(self, column):
+        return self._values[self._positions[column]][self._row]
+
+    def __getattr__(self, name):
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name)
+
+    def get(self, column, default=None):
+        idx = self._positions.get(column)
+        return default if idx is None else self._values[idx][self._row]
+
+    def keys(self):
+        return list(self._columns)
+
+    def values(self):
+        return [values[self._row] for values in self._values]
+
+    def items(self):
+        return list(zip(self._columns, self.values()))
+
+    def to_dict(self):
+        return dict(self.items())
+
+    def __iter__(self):
+        return iter(self._columns)
+
+    def __contains__(self, column):
+        return column in self._positions
+
+    def __len__(self):
+        return len(self._columns)
+
+    def __repr__(self):
+        return repr(self.to_dict())
+
+
+class _Loc(object):
+    # df.loc[key] returns the rows whose index column equals key, or
+    # the row at position key when no index has been set.
+    __slots__ = ['df']
+
+    def __init__(self, df):
+        self.df = df
+
+    def _positions(self, key):
+        if self.df._index is None:
+            return [key]
+        positions = self.df._lookup().get(key)
+        if positions is None:
+            raise KeyError(key)
+        return positions
+
+    def __getitem__(self, key):
+        if isinstance(key, list):
+            positions = []
+            for k in key:
+                positions.extend(self._positions(k))
+        else:
+            positions = self._positions(key)
+        return self.df.take(positions)
+
+
+def _pandas_column(values, dtype, numpy, pandas):
+    # Typed columns go to NumPy with one buffer copy. The copy keeps the
+    # array resizable, arrays can't grow or shrink while a buffer is exported.
+    if isinstance(values, _Codes):
+        codes = numpy.frombuffer(values.codes, values.codes.typecode).copy()
+        return pandas.Categorical.from_codes(codes, values.categories)
+    if not isinstance(values, array):
+        return values
+    data = numpy.frombuffer(values, values.typecode).copy() if len(values) else numpy.array([], values.typecode)
+    if dtype == 'bool':
+        return data.astype(bool)
+    if dtype == 'datetime':
+        return data.view('datetime64[us]')
+    return data
+
+
+def _from_pandas_column(series, numpy, pandas):
+    # Numeric columns without missing values, floats and naive datetimes come
+    # across as raw bytes (NaT is the epoch sentinel), everything else as
+    # Python objects with None for missing.
+    dtype = series.dtype
+    if isinstance(dtype, pandas.CategoricalDtype):
+        categories = series.cat.categories.tolist()
+        typecode = 'b' if len(categories) <= 128 else 'i'
+        codes = series.cat.codes.to_numpy(numpy.dtype(typecode))
+        return _Codes(_frombytes(typecode, codes.tobytes()), categories + [None]), 'category'
+    kind = getattr(dtype, 'kind', 'O')
+    if kind == 'f':
+        data = series.to_numpy('float64', na_value=numpy.nan)
+        return _frombytes('d', data.tobytes()), 'float64'
+    if kind == 'M' and getattr(dtype, 'tz', None) is None:
+        data = series.to_numpy('datetime64[us]').view('int64')
+        return _frombytes(_INT64, data.tobytes()), 'datetime'
+    if not series.hasnans:
+        if kind == 'b':
+            return _frombytes('b', series.to_numpy('int8').tobytes()), 'bool'
+        if kind == 'i' or (kind == 'u' and dtype.itemsize < 8):
+            return _frombytes(_INT64, series.to_numpy('int64').tobytes()), 'int64'
+    values = series.astype(object).where(series.notna(), None).tolist()
+    return _as_storage(values)
 
 
 class DataFrame(object):
     # As the dataframe object does not allow setting columns via
     # attribute access, we take some pre-cautions to prevent it
     # happening accidently.
-    __slots__ = ['data', '_values', '_columns', '_selected_column'] # Python 3
+    __slots__ = ['data', '_values', '_columns', '_dtypes', '_selected_column', '_index', '_index_map', '_shared', '_pd'] # Python 3
 
     # __slots__ not supported in Jython
     def _slot(self, attr, value):
@@ -167,27 +1287,177 @@ class DataFrame(object):
 
     def __init__(self, data=None, values=None, columns=None):
         if data is None:
-            data = {column: [] for column in columns}
-            for row in values:
-                for i, column in enumerate(columns):
-                    data[column].append(row[i])
+            data = dict(zip(columns, _rows_to_columns(values, len(columns))))
         # TODO Test shape
-        self._slot('_values', list(data.values()))
+        _values, dtypes, shared = [], [], []
+        for values in data.values():
+            storage, dtype = _as_storage(values)
+            _values.append(storage)
+            dtypes.append(dtype)
+            # The caller still holds buffers that were used as they are
+            shared.append(storage is values or isinstance(values, Series))
+        self._slot('_values', _values)
         self._slot('_columns', list(data.keys()))
+        self._slot('_dtypes', dtypes)
+        self._slot('_index', None)
+        self._slot('_index_map', None)
+        self._slot('_shared', shared)
+        self._slot('_pd', None)
+
+    @classmethod
+    def _new(cls, columns, values, dtypes, index=None, shared=None):
+        # Build directly from column storage, skipping the dict/row transposition in __init__
+        df = cls.__new__(cls)
+        df._slot('_values', values)
+        df._slot('_columns', columns)
+        df._slot('_dtypes', dtypes)
+        df._slot('_index', index)
+        df._slot('_index_map', None)
+        df._slot('_shared', [False]*len(values) if shared is None else shared)
+        df._slot('_pd', None)
+        return df
+
+    @classmethod
+    def from_rows(cls, rows, columns):
+        columns = list(columns)
+        _values, dtypes = [], []
+        for values in _rows_to_columns(rows, len(columns)):
+            values, dtype = _as_storage(values)
+            _values.append(values)
+            dtypes.append(dtype)
+        return cls._new(columns, _values, dtypes)
+
+    @classmethod
+    def from_records(cls, records, columns=None, fill_value=None, infer_rows=100):
+        records = iter(records)
+        if columns is None:
+            # Schema comes from the first records, later unknown keys are ignored
+            head = list(islice(records, infer_rows))
+            columns = []
+            seen = set()
+            for record in head:
+                for key in record:
+                    if key not in seen:
+                        seen.add(key)
+                        columns.append(key)
+            records = chain(head, records)
+        columns = list(columns)
+        if len(columns) == 1:
+            getter = lambda record, key=columns[0]: (record[key],)
+        else:
+            getter = operator.itemgetter(*columns) if columns else lambda record: ()
+
+        def rows():
+            for record in records:
+                try:
+                    yield getter(record)
+                except KeyError:
+                    yield tuple(record.get(column, fill_value) for column in columns)
+        return cls.from_rows(rows(), columns)
+
+    def _select(self, positions, lazy=False):
+        # Selections over pending columns are composed with their own
+        # selection vector so rows are always looked up in the parent.
+        composed = {}
+        _values = []
+        for idx, values in enumerate(self._values):
+            if isinstance(values, _Mapped):
+                values = self._column(idx)
+            if isinstance(values, _Selection):
+                key = id(values.positions)
+                if key not in composed:
+                    parent = values.positions
+                    composed[key] = [parent[i] for i in positions]
+                values = _Selection(values.values, composed[key])
+            else:
+                values = _Selection(values, positions)
+            _values.append(values if lazy else values.materialize())
+        return _values
+
+    def take(self, positions):
+        return DataFrame._new(list(self._columns), self._select(positions), list(self._dtypes), self._index)
+
+    def set_index(self, column):
+        if column not in self._columns:
+            raise KeyError(column)
+        self._slot('_index', column)
+        self._slot('_index_map', None)
+        return self
+
+    def reset_index(self):
+        self._slot('_index', None)
+        self._slot('_index_map', None)
+        return self
+
+    def _lookup(self):
+        # Key -> row positions, built on first use after set_index or an invalidation
+        if self._index_map is None:
+            index_map = {}
+            for i, key in enumerate(self._decoded(self._columns.index(self._index))):
+                positions = index_map.get(key)
+                if positions is None:
+                    index_map[key] = [i]
+                else:
+                    positions.append(i)
+            self._slot('_index_map', index_map)
+        return self._index_map
+
+    @property
+    def loc(self):
+        return _Loc(self)
+
+    def _column(self, idx):
+        values = self._values[idx]
+        if isinstance(values, (_Selection, _Mapped)):
+            values = self._values[idx] = values.materialize()
+            self._shared[idx] = False
+        return values
+
+    def _writable(self, idx):
+        # Columns are shared copy-on-write, copy before the first write
+        # if another frame or series can still see the buffer.
+        values = self._column(idx)
+        if self._shared[idx]:
+            values = self._values[idx] = values[:]
+            self._shared[idx] = False
+        return values
+
+    def copy(self, deep=False):
+        if deep:
+            _values = [self._column(idx)[:] for idx in range(len(self._values))]
+            return DataFrame._new(list(self._columns), _values, list(self._dtypes), self._index)
+        self._slot('_shared', [True]*len(self._values))
+        return DataFrame._new(list(self._columns), list(self._values), list(self._dtypes),
+                              self._index, [True]*len(self._values))
+
+    def _decoded(self, idx):
+        return _decode(self._column(idx), self._dtypes[idx])
+
+    def _keys(self, idx):
+        # Values to hash a column on, categories keep their codes
+        values = self._column(idx)
+        return values if isinstance(values, _Codes) else self._decoded(idx)
+
+    def _materialize(self):
+        return [self._decoded(idx) for idx in range(len(self._values))]
+
+    def view(self, mask):
+        positions = self._get_row_filter(mask).positions()
+        # The view reads straight from this frame's buffers
+        self._slot('_shared', [True]*len(self._values))
+        return DataFrame._new(list(self._columns), self._select(positions, lazy=True), list(self._dtypes), self._index)
 
     def _get(self, column):
         if isinstance(column, list): # Multiple select
             return DataFrame({c: self.get(c) for c in column})
         if isinstance(column, Series): # Filter
-            _vals = [[] for _ in range(len(self._values))] # Empty list of lists
-            for i, value in enumerate(column):
-                if value:
-                    for j, value in enumerate(self._values):
-                        _vals[j].append(value[i])
-            return DataFrame(values=list(map(list, zip(*_vals))), columns=self._columns)
+            # Work out the selected rows once and compress each column with them
+            return self.take(_as_mask(column).positions())
 
         idx = self._columns.index(column)
-        return Series(self._values[idx])
+        values = self._column(idx)
+        self._shared[idx] = True
+        return Series._wrap(values, self._dtypes[idx])
 
     def get(self, column, default=None):
         try:
@@ -197,130 +1467,316 @@ class DataFrame(object):
 
     def _get_row_filter(self, mask):
         if isinstance(mask, str) and mask == 'all':
-            return [True]*len(self)
-        if isinstance(mask[0], list):
-            _index = []
-            for items in zip(*mask):
-                if all(items):
-                    _index.append(True)
-                else:
-                    _index.append(False)
-            mask = _index
-        return mask
+            return Mask._from_bits((1 << len(self)) - 1, len(self))
+        if isinstance(mask, list) and mask and isinstance(mask[0], (list, Series)):
+            # Every mask in the list has to hold
+            size = min(len(m) for m in mask)
+            combined = Mask._from_bits((1 << size) - 1, size)
+            for m in mask:
+                combined = combined & m
+            return combined
+        return _as_mask(mask)
 
     def drop(self, mask):
         mask = self._get_row_filter(mask)
-        _values = []
-        for row in self._values:
-            _row_values = []
-            for i, remove in enumerate(mask):
-                if not remove:
-                    _row_values.append(row[i])
-            _values.append(_row_values)
-        self._slot('_values', _values)
+        removed = mask.positions()
+        removed.extend(range(len(mask), len(self)))
+        if not removed:
+            return
+        self._slot('_pd', None)
+        # Owned columns are compacted in place, pending columns stay pending with
+        # a shorter selection vector and shared ones are gathered into a new buffer.
+        # Gathering also wins when so many rows go that the runs to move are short.
+        compact = len(removed) * 8 < len(self)
+        selections = None
+        for idx, values in enumerate(self._values):
+            if isinstance(values, _Mapped):
+                values = self._column(idx)
+            if isinstance(values, _Selection) or self._shared[idx] or not compact:
+                if selections is None:
+                    selections = self._select((~mask).positions(), lazy=True)
+                pending = isinstance(values, _Selection)
+                self._values[idx] = selections[idx] if pending else selections[idx].materialize()
+                self._shared[idx] = False
+            else:
+                _compact(values, removed)
+        self._slot('_index_map', None)
 
     def set(self, mask, column, value):
         mask = self._get_row_filter(mask)
-        _values = []
+        if len(mask) > len(self): # Rows past the end are ignored
+            mask = Mask._from_bits(mask.bits & ((1 << len(self)) - 1), len(self))
+        self._slot('_pd', None)
         try:
             idx = self._columns.index(column)
         except ValueError: # Add New Column
             self._columns.append(column)
             idx = self._columns.index(column)
             self._values.append([None]*len(self))
-
-        for i, (should_apply, current_value) in enumerate(zip(mask, self._values[idx])):
-            if should_apply:
-                if isinstance(value, (Series, list)):
-                    _values.append(value[i])
-                else:
-                    _values.append(value)
+            self._dtypes.append('object')
+            self._shared.append(False)
+
+        if isinstance(value, Series):
+            if len(value) == len(self) and mask.all():
+                # Take the series' storage as it is, keeping its dtype
+                self._values[idx], self._dtypes[idx] = value.data, value.dtype
+                self._shared[idx] = True
+                if column == self._index:
+                    self._slot('_index_map', None)
+                return
+            value = value.tolist()
+        positions = mask.positions()
+        if isinstance(value, list):
+            updates = [value[i] for i in positions]
+        else:
+            updates = [value]*len(positions)
+        if not self._write(idx, positions, updates):
+            # The dtype may change, rebuild the column from its values
+            if isinstance(self._column(idx), list) and _decoder(self._column(idx), self._dtypes[idx]) is None:
+                _values = self._writable(idx)
             else:
-                _values.append(current_value)
-        self._values[idx] = _values
-
-    def iterrows(self):
-        for i in range(len(self)):
-            row = {}
-            for j in range(len(self._columns)):
-                row[self._columns[j]] = self._values[j][i]
-            yield row
+                _values = list(self._decoded(idx))
+            for i, v in zip(positions, updates):
+                _values[i] = v
+            self._values[idx], self._dtypes[idx] = _as_storage(_values)
+        if column == self._index:
+            self._slot('_index_map', None)
+
+    def _write(self, idx, positions, updates):
+        # Write straight into an array column when every new value keeps its dtype
+        dtype = self._dtypes[idx]
+        if dtype == 'category':
+            values = self._writable(idx)
+            lookup = values.lookup()
+            for i, v in zip(positions, updates):
+                values.codes[i] = values.code(v, lookup)
+            return True
+        if not isinstance(self._column(idx), array) or not all(_fits(dtype, v) for v in updates):
+            return False
+        if not updates:
+            return True
+        values = self._writable(idx)
+        if dtype == 'datetime':
+            updates = [_epoch(v) for v in updates]
+        try:
+            for i, v in zip(positions, updates):
+                values[i] = v
+        except OverflowError:
+            return False
+        return True
+
+    def _gather_missing(self, idx, positions):
+        dtype = self._dtypes[idx]
+        if None not in positions:
+            return _gather(self._column(idx), positions), dtype
+        values = self._decoded(idx)
+        return _as_storage([values[i] if i is not None else None for i in positions], dtype)
+
+    def merge(self, other, on, how='inner', suffixes=('_x', '_y')):
+        if how not in ('inner', 'left', 'outer'):
+            raise ValueError('{} is not a supported join'.format(how))
+        if not isinstance(on, list):
+            on = [on]
+        left_keys, right_keys = [], []
+        for column in on:
+            lidx, ridx = self._columns.index(column), other._columns.index(column)
+            lcol, rcol = self._column(lidx), other._column(ridx)
+            if (isinstance(lcol, array) and isinstance(rcol, array) and lcol.typecode == rcol.typecode
+                    or type(lcol) is list and type(rcol) is list): # Hash the raw storage when it is comparable
+                left_keys.append(lcol)
+                right_keys.append(rcol)
+            else:
+                left_keys.append(self._decoded(lidx))
+                right_keys.append(other._decoded(ridx))
+        if len(on) == 1:
+            left_keys, right_keys = left_keys[0], right_keys[0]
+        else:
+            left_keys, right_keys = list(zip(*left_keys)), list(zip(*right_keys))
+        left_pos, right_pos = _hash_join(left_keys, right_keys, how)
+
+        columns, _values, dtypes = [], [], []
+        for column in on:
+            lidx = self._columns.index(column)
+            values, dtype = self._gather_missing(lidx, left_pos)
+            if how == 'outer' and None in left_pos:
+                # Right only rows take their key from the right frame
+                lvalues, rvalues = self._decoded(lidx), other._decoded(other._columns.index(column))
+                values, dtype = _as_storage([
+                    lvalues[i] if i is not None else rvalues[j] for i, j in zip(left_pos, right_pos)
+                ], dtype)
+            columns.append(column)
+            _values.append(values)
+            dtypes.append(dtype)
+        for df, positions, suffix, others in ((self, left_pos, suffixes[0], other._columns),
+                                              (other, right_pos, suffixes[1], self._columns)):
+            for idx, column in enumerate(df._columns):
+                if column in on:
+                    continue
+                values, dtype = df._gather_missing(idx, positions)
+                columns.append('{}{}'.format(column, suffix) if column in others else column)
+                _values.append(values)
+                dtypes.append(dtype)
+        return DataFrame._new(columns, _values, dtypes)
+
+    def sort_values(self, by, ascending=True):
+        if not isinstance(by, list):
+            by = [by]
+        if not isinstance(ascending, list):
+            ascending = [ascending]*len(by)
+        # One stable sort per key, least significant first, then a single gather
+        order = list(range(len(self)))
+        for column, asc in reversed(list(zip(by, ascending))):
+            idx = self._columns.index(column)
+            _argsort(_sortable(self._column(idx), self._dtypes[idx]), asc, order)
+        return self.take(order)
+
+    def iterrows(self, reuse=False):
+        if reuse:
+            # A single view is moved along the rows instead of building a dict per row
+            row = _RowView(self._columns, self._materialize())
+            for i in range(len(self)):
+                row._row = i
+                yield row
+            return
+        columns = self._columns
+        for values in _izip(*self._materialize()):
+            yield dict(_izip(columns, values))
+
+    def itertuples(self, name='Row'):
+        rows = _izip(*self._materialize())
+        if name is None:
+            return rows
+        make = namedtuple(name, self._columns, rename=True)._make
+        return (make(values) for values in rows)
+
+    def iterbatches(self, size):
+        # Chunks of at most size rows sliced straight from the column storage
+        _values = [self._column(idx) for idx in range(len(self._values))]
+        for start in range(0, len(self), size):
+            yield DataFrame._new(list(self._columns), [values[start:start + size] for values in _values],
+                                 list(self._dtypes), self._index)
 
     def to_dict(self):
         d = {}
         for idx, column in enumerate(self._columns):
-            d[column] = self._values[idx]
+            values = self._decoded(idx)
+            d[column] = values.tolist() if isinstance(values, array) else list(values) if isinstance(values, _Codes) else values
         return d
 
+    def save(self, path, allow_pickle=False):
+        # Written beside path and moved over it, so frames loaded from path
+        # keep reading their mapped columns from the old file
+        temporary = '{}.{}.tmp'.format(path, os.getpid())
+        try:
+            with open(temporary, 'wb') as f:
+                _write_snapshot(self, f, allow_pickle)
+            _replace(temporary, path)
+        except BaseException:
+            if os.path.exists(temporary):
+                os.remove(temporary)
+            raise
+
     def to_pandas(self):
+        import numpy
         import pandas
-        return pandas.DataFrame(self.to_dict())
+        data = dict((column, _pandas_column(self._column(idx), self._dtypes[idx], numpy, pandas))
+                    for idx, column in enumerate(self._columns))
+        return pandas.DataFrame(data, columns=list(self._columns))
+
+    @classmethod
+    def from_pandas(cls, pdf):
+        import numpy
+        import pandas
+        _values, dtypes = [], []
+        for column in pdf.columns:
+            values, dtype = _from_pandas_column(pdf[column], numpy, pandas)
+            _values.append(values)
+            dtypes.append(dtype)
+        return cls._new(list(pdf.columns), _values, dtypes)
 
     def pivot(self, index, columns, values):
         iidx = self._columns.index(index)
         cidx = self._columns.index(columns)
         vidx = self._columns.index(values)
         _values = { index: set() }
-        for column in self._values[cidx]:
+        for column in self._decoded(cidx):
             _values[column] = []
-        for idx, col, val in zip(self._values[iidx], self._values[cidx], self._values[vidx]):
+        for idx, col, val in zip(self._decoded(iidx), self._decoded(cidx), self._decoded(vidx)):
             _values[index].add(idx)
             _values[col].append(val)
         return DataFrame(_values)
 
-    def pivot_table(self, index, values, columns, fill_value=None):
-        # Build shape
-        _values = {}
-        for i in index:
-            _values[i] = []
-        for value_column in values:
-            for c in columns:
-                cidx = self._columns.index(c)
-                for column in self._values[cidx]:
-                    _values['{}_{}'.format(value_column, column)] = []
-
+    def groupby(self, keys):
+        return GroupBy(self, keys)
+
+    def map_partitions(self, fn, n_workers=None, executor='process'):
+        # fn gets a frame per contiguous block of rows, frames, series and lists
+        # it returns are concatenated in order, anything else is returned as a list.
+        n_workers = _workers(n_workers)
+        _values = [self._column(idx) for idx in range(len(self._values))]
+        payloads = [(self._columns, [values[start:stop] for values in _values], self._dtypes)
+                    for start, stop in _partitions(len(self), n_workers)] or [(self._columns, _values, self._dtypes)]
+        results = _run_partitions(partial(_frame_partition, fn), payloads, n_workers, executor)
+        return _concat_results(results)
+
+    def lazy(self):
+        return LazyFrame(self)
+
+    def pivot_table(self, index, values, columns, fill_value=None, aggfunc='first'):
+        step, final = _aggregator(aggfunc)
+        row_ids, keys = _factorize([self._keys(self._columns.index(i)) for i in index])
+
+        # One pass per (column, value column) pair, accumulating into output slots.
+        # Categorical columns are bucketed on their codes, each decoded once.
+        cells = {}
+        column_values = {}
         for column in columns:
-            column_values = set(self[column])
-            combos = set()
-            for index_values in zip(*self.get(index)._values):
-                if index_values not in combos: # Make sure we dont revist the same index combination
-                    combos.add(index_values)
-                    
-                    filters = []
-                    for idx, idx_val in zip(index, index_values):
-                        filters.append((self[idx] == idx_val)) # Filter by each index value
-                        _values[idx].append(idx_val) # and add index values while looping
-
-                    # Combine filter results (list of bools) into 1 filter
-                    combined_filters = []
-                    for pair in zip(*filters):
-                        combined_filters.append(all(pair))
-                    # Get the filtered subset
-                    sset = self[Series(combined_filters)]
-
-                    for column_value in column_values:
-                        for value_column in values:
-                            value = sset[sset[column] == column_value][value_column]
-                            if len(value) > 0:
-                                value = value[0]
-                            else:
-                                value = fill_value
-                            _values['{}_{}'.format(value_column, column_value)].append(value)
+            cidx = self._columns.index(column)
+            column_data = self._keys(cidx)
+            table = None
+            if isinstance(column_data, _Codes):
+                column_data, table = column_data.codes, column_data.table
+            seen = column_values.setdefault(column, [])
+            for value_column in values:
+                value_data = self._decoded(self._columns.index(value_column))
+                slots = cells.setdefault((value_column, column), {})
+                for row, column_value, value in zip(row_ids, column_data, value_data):
+                    slot = slots.get(column_value)
+                    if slot is None:
+                        slot = slots[column_value] = {}
+                        if all(key != column_value for key, _ in seen):
+                            seen.append((column_value, column_value if table is None else table[column_value]))
+                    slot[row] = step(slot.get(row, _MISSING), value)
 
+        _values = {}
+        for i, idx in enumerate(index):
+            _values[idx] = [key[i] for key in keys]
+        for value_column in values:
+            for column in columns:
+                slots = cells[(value_column, column)]
+                for key, column_value in column_values[column]:
+                    slot = slots[key]
+                    _values['{}_{}'.format(value_column, column_value)] = [
+                        final(slot[row]) if row in slot else fill_value
+                        for row in range(len(keys))
+                    ]
         return DataFrame(_values)
 
     @property
     def pd(self):
-        return self.to_pandas()
+        # Cached until the frame is changed through set or drop
+        if self._pd is None:
+            self._slot('_pd', self.to_pandas())
+        return self._pd
 
     def head(self, num=5):
         from tabulate import tabulate
-        cut_values = zip(*[v[:num] for v in self._values])
+        cut_values = zip(*[v[:num] for v in self._materialize()])
         return tabulate(cut_values, headers=self._columns)
 
     def tail(self, num=5):
         from tabulate import tabulate
-        cut_values = zip(*[v[len(v)-num:] for v in self._values])
+        cut_values = zip(*[v[len(v)-num:] for v in self._materialize()])
         return tabulate(cut_values, headers=self._columns)
 
     def __getitem__(self, name):
@@ -345,3 +1801,898 @@ class DataFrame(object):
 
     def __contains__(self, value):
         return value in self._columns
+
+
+class GroupBy(object):
+    def __init__(self, df, keys):
+        if not isinstance(keys, list):
+            keys = [keys]
+        self.df = df
+        self.keys = keys
+
+    def agg(self, aggregations):
+        group_ids, keys = _factorize([self.df._get(key) for key in self.keys])
+        _values = {}
+        for i, key in enumerate(self.keys):
+            _values[key] = [k[i] for k in keys]
+        for column, aggfuncs in aggregations.items():
+            data = self.df._get(column)
+            if isinstance(aggfuncs, list):
+                names = ['{}_{}'.format(column, getattr(a, '__name__', a)) for a in aggfuncs]
+            else:
+                aggfuncs, names = [aggfuncs], [column]
+            for aggfunc, name in zip(aggfuncs, names):
+                step, final = _aggregator(aggfunc)
+                accs = [_MISSING]*len(keys)
+                for group, value in zip(group_ids, data):
+                    accs[group] = step(accs[group], value)
+                _values[name] = [final(acc) for acc in accs]
+        return DataFrame(_values)
+
+
+_WINDOW_UNITS = {'us': 1, 'ms': 1000, 's': 1000000, 'min': 60000000, 'h': 3600000000, 'd': 86400000000}
+
+
+def _window_duration(window):
+    # Microseconds in a timedelta or a string like '30s', '5min' or '2h'
+    if isinstance(window, dt.timedelta):
+        duration = (window.days * 86400 + window.seconds) * 1000000 + window.microseconds
+    else:
+        match = re.match(r'^(\d+)\s*([a-z]+)$', window.strip())
+        if match is None or match.group(2) not in _WINDOW_UNITS:
+            raise ValueError('{} is not a supported window'.format(window))
+        duration = int(match.group(1)) * _WINDOW_UNITS[match.group(2)]
+    if duration <= 0:
+        raise ValueError('window must be positive')
+    return duration
+
+
+class Rolling(object):
+    # Window aggregations in one pass each. Every row enters the window once
+    # and leaves it once, sums are kept running and min/max use a deque of
+    # candidate rows whose values only increase (min) or decrease (max).
+    # Missing values (None, NaN) are skipped and don't count to min_periods.
+    # Running sums are compensated, ints add up exactly either way.
+    def __init__(self, series, window, min_periods=None, on=None):
+        self.values = _decode(series.data, series.dtype)
+        if window is None: # Expanding
+            self.starts = [0]*len(series)
+            default = 1
+        elif isinstance(window, _INT_TYPES) and not isinstance(window, bool):
+            if window <= 0:
+                raise ValueError('window must be positive')
+            self.starts = [max(0, i - window + 1) for i in range(len(series))]
+            default = window
+        elif isinstance(window, _STRING_TYPES + (dt.timedelta,)):
+            duration = _window_duration(window)
+            if on is None:
+                raise ValueError('A {} window needs the datetimes to roll over, pass on='.format(window))
+            self.starts = self._time_starts(on, duration)
+            default = 1
+        else:
+            raise ValueError('window must be a number of rows or a duration, not {!r}'.format(window))
+        self.min_periods = default if min_periods is None else min_periods
+
+    def _time_starts(self, on, duration):
+        # Two pointers, the window is (t - duration, t] so a row leaves once t moves past it
+        if isinstance(on, Series) and on.dtype == 'datetime' and isinstance(on.data, array):
+            times = on.data
+        else:
+            times = [_NAT if value is None else _to_epoch(value) for value in on]
+        if _NAT in times:
+            raise ValueError('on has missing datetimes')
+        if len(times) != len(self.values):
+            raise ValueError('on has {} rows, expected {}'.format(len(times), len(self.values)))
+        starts = []
+        start = 0
+        previous = None
+        for t in times:
+            if previous is not None and t < previous:
+                raise ValueError('on must be sorted in ascending order')
+            previous = t
+            while times[start] <= t - duration:
+                start += 1
+            starts.append(start)
+        return starts
+
+    def _running(self, finish):
+        # finish(count, total) for each window
+        values = self.values
+        out = []
+        # Knuth's two-sum: the rounding error of every addition is kept in
+        # compensation, so removing a large value doesn't cancel the small ones.
+        # An inf makes it NaN, the window's plain total is used then.
+        count, total, compensation = 0, 0, 0
+        left = 0
+        for value, start in _izip(values, self.starts):
+            if value is not None and value == value:
+                count += 1
+                result = total + value
+                added = result - total
+                compensation += (total - (result - added)) + (value - added)
+                total = result
+            while left < start:
+                value = values[left]
+                left += 1
+                if value is not None and value == value:
+                    count -= 1
+                    if not count:
+                        total, compensation = 0, 0
+                        continue
+                    result = total - value
+                    removed = total - result
+                    compensation += (total - (result + removed)) + (removed - value)
+                    total = result
+            if count >= self.min_periods:
+                out.append(finish(count, total + compensation if compensation == compensation else total))
+            else:
+                out.append(None)
+        return Series._from_values(out)
+
+    def _deviation(self):
+        # Welford's update, adding and removing values from a running mean
+        # and m2, the sum of squared differences from it
+        values = self.values
+        out = []
+        count, mean, m2 = 0, 0.0, 0.0
+        left = 0
+        for value, start in _izip(values, self.starts):
+            if value is not None and value == value:
+                count += 1
+                delta = value - mean
+                mean += delta / float(count)
+                m2 += delta * (value - mean)
+            while left < start:
+                value = values[left]
+                left += 1
+                if value is None or value != value:
+                    continue
+                count -= 1
+                if count == 0:
+                    mean, m2 = 0.0, 0.0
+                    continue
+                delta = value - mean
+                mean -= delta / float(count)
+                m2 -= delta * (value - mean)
+            if count >= self.min_periods and count > 1:
+                out.append(math.sqrt(max(m2, 0.0) / (count - 1)))
+            else:
+                out.append(None)
+        return Series._from_values(out)
+
+    def _extreme(self, keep):
+        # keep(candidate, value) is True while an older candidate can still be the answer
+        values = self.values
+        out = []
+        candidates = deque()
+        count = 0
+        left = 0
+        for i, (value, start) in enumerate(_izip(values, self.starts)):
+            if value is not None and value == value:
+                while candidates and not keep(values[candidates[-1]], value):
+                    candidates.pop()
+                candidates.append(i)
+                count += 1
+            while left < start:
+                value = values[left]
+                if value is not None and value == value:
+                    count -= 1
+                left += 1
+            while candidates and candidates[0] < start:
+                candidates.popleft()
+            out.append(values[candidates[0]] if candidates and count >= self.min_periods else None)
+        return Series._from_values(out)
+
+    def sum(self):
+        return self._running(lambda count, total: total)
+
+    def mean(self):
+        return self._running(lambda count, total: total / float(count) if count else None)
+
+    def std(self):
+        # Sample standard deviation like pandas, None for fewer than two values
+        return self._deviation()
+
+    def min(self):
+        return self._extreme(operator.lt)
+
+    def max(self):
+        return self._extreme(operator.gt)
+
+
+class Expr(object):
+    # A node in a lazy query plan. build(scope) compiles it into a
+    # fn(i, vals) evaluated for row i, vals holding the current row's
+    # values for columns assigned earlier in the plan.
+    def __init__(self, columns, build, column=None, literal=_MISSING):
+        self.columns = columns
+        self.build = build
+        self.column = column
+        self.literal = literal
+
+    @classmethod
+    def col(cls, name):
+        return cls(frozenset([name]), lambda scope: scope.reader(name), column=name)
+
+    @classmethod
+    def lit(cls, value):
+        if isinstance(value, Expr):
+            return value
+        return cls(frozenset(), lambda scope: lambda i, vals: value, literal=value)
+
+    def _binary(self, other, op, reverse=False):
+        other = Expr.lit(other)
+        left, right = (other, self) if reverse else (self, other)
+
+        def build(scope):
+            lfn, rfn = left.build(scope), right.build(scope)
+            return lambda i, vals: op(lfn(i, vals), rfn(i, vals))
+        return Expr(left.columns | right.columns, build)
+
+    def _compare(self, other, op):
+        left, right = self, Expr.lit(other)
+
+        def build(scope):
+            # Literals compared with a datetime column are parsed once up front
+            operands = []
+            for side, opposite in ((left, right), (right, left)):
+                if side.literal is not _MISSING and scope.dtype(opposite.column) == 'datetime':
+                    value = parse_date(side.literal)
+                    operands.append(lambda i, vals: value)
+                else:
+                    operands.append(side.build(scope))
+            lfn, rfn = operands
+            return lambda i, vals: op(lfn(i, vals), rfn(i, vals))
+        return Expr(left.columns | right.columns, build)
+
+    def apply(self, fn):
+        expr = self
+
+        def build(scope):
+            efn = expr.build(scope)
+            return lambda i, vals: fn(efn(i, vals))
+        return Expr(self.columns, build)
+
+    def __and__(self, other):
+        return self._binary(other, lambda l, r: bool(l and r))
+
+    def __or__(self, other):
+        return self._binary(other, lambda l, r: bool(l or r))
+
+    def __invert__(self):
+        return self.apply(operator.not_)
+
+    def __eq__(self, other):
+        return self._compare(other, operator.eq)
+
+    def __ne__(self, other):
+        return self._compare(other, operator.ne)
+
+    def __ge__(self, other):
+        return self._compare(other, operator.ge)
+
+    def __gt__(self, other):
+        return self._compare(other, operator.gt)
+
+    def __le__(self, other):
+        return self._compare(other, operator.le)
+
+    def __lt__(self, other):
+        return self._compare(other, operator.lt)
+
+    def __add__(self, other):
+        return self._binary(other, operator.add)
+
+    def __sub__(self, other):
+        return self._binary(other, operator.sub)
+
+    def __mul__(self, other):
+        return self._binary(other, operator.mul)
+
+    def __div__(self, other):
+        return self._binary(other, operator.truediv)
+
+    def __truediv__(self, other):
+        return self._binary(other, operator.truediv)
+
+    def __rdiv__(self, other):
+        return self._binary(other, operator.truediv, reverse=True)
+
+    def __rtruediv__(self, other):
+        return self._binary(other, operator.truediv, reverse=True)
+
+    def __rsub__(self, other):
+        return self._binary(other, operator.sub, reverse=True)
+
+    def __rmul__(self, other):
+        return self._binary(other, operator.mul, reverse=True)
+
+    def __radd__(self, other):
+        return self._binary(other, operator.add, reverse=True)
+
+    def __abs__(self):
+        return self.apply(abs)
+
+    __hash__ = object.__hash__
+
+
+class _Scope(object):
+    # Resolves column names while a plan is compiled, either to the
+    # source frame's storage or to a slot assigned by an earlier set.
+    def __init__(self, df):
+        self.df = df
+        self.bindings = dict((name, ('source', idx)) for idx, name in enumerate(df._columns))
+        self.dtypes = dict(zip(df._columns, df._dtypes))
+
+    def dtype(self, name):
+        return self.dtypes.get(name)
+
+    def reader(self, name):
+        try:
+            kind, idx = self.bindings[name]
+        except KeyError:
+            raise ValueError('{} is not in the plan'.format(name))
+        if kind == 'slot':
+            return lambda i, vals: vals[idx]
+        data = self.df._column(idx)
+        decode = _decoder(data, self.df._dtypes[idx])
+        if decode is None:
+            return lambda i, vals: data[i]
+        return lambda i, vals: decode(data[i])
+
+
+class LazyFrame(object):
+    def __init__(self, df, steps=None):
+        self._df = df
+        self._steps = steps or []
+
+    def _with(self, step):
+        return LazyFrame(self._df, self._steps + [step])
+
+    def __getitem__(self, key):
+        if isinstance(key, Expr): # Filter
+            return self._with(('filter', key))
+        if isinstance(key, list): # Multiple select
+            return self._with(('select', key))
+        return Expr.col(key)
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return Expr.col(name)
+
+    def set(self, mask, column, value):
+        mask = None if isinstance(mask, str) and mask == 'all' else mask
+        self._steps.append(('set', mask, column, Expr.lit(value)))
+
+    def __setitem__(self, name, value):
+        self.set('all', name, value)
+
+    def _compile(self):
+        scope = _Scope(self._df)
+        columns = list(self._df._columns)
+        program = []
+        set_slots = [] # slot assigned by each program entry, None for filters
+        slots = 0
+        for step in self._steps:
+            if step[0] == 'select':
+                for name in step[1]:
+                    if name not in columns:
+                        raise ValueError('{} is not in the plan'.format(name))
+                columns = list(step[1])
+                scope.bindings = dict((name, scope.bindings[name]) for name in columns)
+            elif step[0] == 'filter':
+                predicate = step[1].build(scope)
+                # Push the filter down to just after the sets it depends on
+                depends = [scope.bindings[name][1] for name in step[1].columns
+                           if scope.bindings.get(name, ('source',))[0] == 'slot']
+                pos = 0
+                for i, slot in enumerate(set_slots):
+                    if slot is not None and slot in depends:
+                        pos = i + 1
+                while pos < len(program) and set_slots[pos] is None:
+                    pos += 1
+                program.insert(pos, predicate)
+                set_slots.insert(pos, None)
+            else:
+                _, mask, column, value = step
+                mask_fn = mask.build(scope) if mask is not None else None
+                value_fn = value.build(scope)
+                previous = scope.reader(column) if column in scope.bindings else None
+                if column not in columns:
+                    columns.append(column)
+                slot = slots
+                slots += 1
+                scope.bindings[column] = ('slot', slot)
+                scope.dtypes.pop(column, None)
+                program.append(self._assignment(slot, mask_fn, value_fn, previous))
+                set_slots.append(slot)
+        return scope, columns, program, slots
+
+    @staticmethod
+    def _assignment(slot, mask, value, previous):
+        def assign(i, vals):
+            if mask is None or mask(i, vals):
+                vals[slot] = value(i, vals)
+            else:
+                vals[slot] = previous(i, vals) if previous is not None else None
+            return True
+        return assign
+
+    def collect(self):
+        scope, columns, program, slots = self._compile()
+        outputs = [(name, scope.bindings[name][1], []) for name in columns
+                   if scope.bindings[name][0] == 'slot']
+
+        # Single fused pass, a row stops at the first filter it fails
+        vals = [None]*slots
+        positions = []
+        for i in range(len(self._df)):
+            for step in program:
+                if not step(i, vals):
+                    break
+            else:
+                positions.append(i)
+                for _, slot, out in outputs:
+                    out.append(vals[slot])
+
+        computed = dict((name, out) for name, _, out in outputs)
+        _values, dtypes = [], []
+        for name in columns:
+            if name in computed:
+                values, dtype = _as_storage(computed[name])
+            else:
+                idx = scope.bindings[name][1]
+                values, dtype = _gather(self._df._column(idx), positions), self._df._dtypes[idx]
+            _values.append(values)
+            dtypes.append(dtype)
+        return DataFrame._new(columns, _values, dtypes)
+
+
+_CSV_CHUNKSIZE = 65536
+_CSV_CONVERTERS = {
+    'int64': int,
+    'float64': lambda value: float(value) if value.strip() else float('nan'),
+    'bool': lambda value: value.strip().lower() in ('true', '1', 'yes'),
+}
+
+# int() and float() also take '1_0', 'nan' and 'inf', only plain numbers are inferred
+_CSV_NUMBERS = {
+    'int64': (int, re.compile(r'\s*[-+]?[0-9]+\s*$')),
+    'float64': (float, re.compile(r'\s*[-+]?([0-9]+\.?[0-9]*|\.[0-9]+)([eE][-+]?[0-9]+)?\s*$')),
+}
+
+
+def _csv_chunks(path, chunksize, encoding, kwargs):
+    # Yields the header and a list of string columns for every chunksize
+    # rows, or once for the whole file when chunksize is None.
+    if hasattr(path, 'read'):
+        f, close = path, False
+    elif sys.version_info[0] < 3:
+        f, close = open(path, 'rb'), True
+    else:
+        f, close = open(path, 'r', newline='', encoding=encoding), True
+    try:
+        reader = csv.reader(f, **kwargs)
+        header = next(reader, None)
+        if header is None:
+            return
+        width = len(header)
+        columns, count, emitted = [[] for _ in header], 0, False
+        while True:
+            size = _BATCH_ROWS if chunksize is None else min(_BATCH_ROWS, chunksize - count)
+            batch = list(islice(reader, size))
+            rows = [row for row in batch if row] # Skip blank lines
+            if set(map(len, rows)) - set([width]):
+                for row in rows:
+                    if len(row) > width:
+                        raise ValueError('Expected {} fields, saw {}: {}'.format(width, len(row), row))
+                rows = [row + ['']*(width - len(row)) for row in rows]
+            if rows:
+                _transpose_into(columns, rows)
+                count += len(rows)
+            if count and (not batch or count == chunksize):
+                yield header, columns
+                columns, count, emitted = [[] for _ in header], 0, True
+            if not batch:
+                break
+        if not emitted:
+            yield header, columns
+    finally:
+        if close:
+            f.close()
+
+
+def _csv_numbers(values, dtype=None):
+    # Numeric storage for a column of strings, None when one isn't a number.
+    # Blank values are missing and make the column float64, as does a later
+    # chunk of a column that earlier chunks read as int64.
+    if dtype != 'float64':
+        convert, pattern = _CSV_NUMBERS['int64']
+        if all(map(pattern.match, values)):
+            try:
+                return array(_INT64, map(convert, values)), 'int64'
+            except OverflowError:
+                pass
+    convert, pattern = _CSV_NUMBERS['float64']
+    numbers = []
+    for value in values:
+        if pattern.match(value):
+            numbers.append(convert(value))
+        elif not value.strip():
+            numbers.append(float('nan'))
+        else:
+            return None
+    return array('d', numbers), 'float64'
+
+
+def _csv_column(name, values, dtypes, dates, inferred=None):
+    if name in dates:
+        return _as_storage(parse_dates(values), 'datetime')
+    dtype = dtypes.get(name)
+    if dtype is None and values: # Numbers are worth a try, anything else stays a string
+        previous = inferred.get(name) if inferred else None
+        if previous != 'object':
+            numbers = _csv_numbers(values, previous)
+            if numbers is not None:
+                return numbers
+            if previous is not None:
+                raise ValueError('Column {} was read as {} from earlier chunks but holds a string, '
+                                 'pass its dtype to read it as something else'.format(name, previous))
+    if dtype is None or dtype == 'object':
+        return values, 'object'
+    if dtype == 'category':
+        return _as_storage(values, 'category')
+    if dtype == 'datetime':
+        return _as_storage(parse_dates(values), 'datetime')
+    if callable(dtype):
+        return _as_storage([dtype(value) for value in values])
+    try:
+        convert = _CSV_CONVERTERS[dtype]
+    except KeyError:
+        raise ValueError('{} is not a supported dtype'.format(dtype))
+    return _as_storage([convert(value) for value in values], dtype)
+
+
+def _csv_frame(header, columns, dtypes, dates, inferred=None):
+    _values, _dtypes = [], []
+    for name, values in zip(header, columns):
+        values, dtype = _csv_column(name, values, dtypes or {}, dates or [], inferred)
+        _values.append(values)
+        _dtypes.append(dtype)
+    return DataFrame._new(list(header), _values, _dtypes)
+
+
+def iter_csv(path, chunksize=_CSV_CHUNKSIZE, dtypes=None, parse_dates=None, encoding='utf-8', **kwargs):
+    if chunksize < 1:
+        raise ValueError('chunksize must be at least 1, got {}'.format(chunksize))
+    return _iter_csv(path, chunksize, dtypes, parse_dates, encoding, kwargs)
+
+
+def _iter_csv(path, chunksize, dtypes, parse_dates, encoding, kwargs):
+    # Each chunk is read with the dtypes of the ones before it
+    inferred = None
+    for header, columns in _csv_chunks(path, chunksize, encoding, kwargs):
+        if columns and len(columns[0]) > 0:
+            df = _csv_frame(header, columns, dtypes, parse_dates, inferred)
+            inferred = dict(zip(header, df._dtypes))
+            yield df
+
+
+def read_csv(path, chunksize=None, dtypes=None, parse_dates=None, encoding='utf-8', **kwargs):
+    if chunksize is not None:
+        return iter_csv(path, chunksize, dtypes, parse_dates, encoding, **kwargs)
+    for header, columns in _csv_chunks(path, None, encoding, kwargs):
+        return _csv_frame(header, columns, dtypes, parse_dates)
+    return DataFrame({})
+
+
+# Snapshots are the magic, a little endian 8 byte header length, a JSON
+# header and then 8 byte aligned blocks for every column. Numeric and datetime
+# columns are their raw array bytes, text columns an int64 offsets block, the
+# utf-8 data and a null flag per row when there are missing values. Other
+# object columns are pickled, unpickling runs code from the file so it is
+# only done when the caller passes allow_pickle.
+_SNAPSHOT_MAGIC = b'MFRAME\x00\x01'
+_TEXT = type(u'')
+
+
+def _native(value):
+    # JSON gives unicode on Python 2, keep plain ascii names as str there
+    if str is bytes and isinstance(value, _TEXT):
+        try:
+            return value.encode('ascii')
+        except UnicodeError:
+            pass
+    return value
+
+
+def _snapshot_blocks(values):
+    # Returns the kind of encoding and its blocks for one column's storage
+    if isinstance(values, array):
+        return 'array', [_tobytes(values)]
+    if isinstance(values, _Codes):
+        kind, blocks = _snapshot_blocks(values.categories)
+        return 'category:{}:{}'.format(values.codes.typecode, kind), [_tobytes(values.codes)] + blocks
+    text = all(value is None or isinstance(value, _TEXT) for value in values)
+    if text or all(value is None or isinstance(value, bytes) for value in values):
+        encoded = [b'' if value is None else value.encode('utf-8') if text else value for value in values]
+        offsets = array(_INT64, [0])
+        position = 0
+        for value in encoded:
+            position += len(value)
+            offsets.append(position)
+        blocks = [_tobytes(offsets), b''.join(encoded)]
+        if None in values:
+            blocks.append(bytes(bytearray(value is None for value in values)))
+        return 'text' if text else 'bytes', blocks
+    return 'pickle', [pickle.dumps(values, 2)]
+
+
+def _snapshot_values(kind, dtype, blocks, swap):
+    if kind == 'array':
+        values = _frombytes(_TYPECODES[dtype], blocks[0])
+        if swap:
+            values.byteswap()
+        return values
+    if kind.startswith('category:'):
+        _, typecode, kind = kind.split(':', 2)
+        codes = _frombytes(typecode, blocks[0])
+        if swap:
+            codes.byteswap()
+        return _Codes(codes, list(_snapshot_values(kind, 'object', blocks[1:], swap)) + [None])
+    if kind in ('text', 'bytes'):
+        offsets = _frombytes(_INT64, blocks[0])
+        if swap:
+            offsets.byteswap()
+        data = bytes(blocks[1])
+        decode = (lambda b: b.decode('utf-8')) if kind == 'text' else bytes
+        values = [decode(data[offsets[i]:offsets[i + 1]]) for i in range(len(offsets) - 1)]
+        if len(blocks) > 2:
+            values = [None if missing else value for value, missing in zip(values, bytearray(blocks[2]))]
+        return values
+    return pickle.loads(bytes(blocks[0]))
+
+
+class _Mapped(object):
+    # A snapshot column that is only read from the file when first used
+    __slots__ = ['source', 'meta', 'base', 'swap']
+
+    def __init__(self, source, meta, base, swap):
+        self.source = source
+        self.meta = meta
+        self.base = base
+        self.swap = swap
+
+    def materialize(self):
+        blocks = [self.source[self.base + offset:self.base + offset + size] for offset, size in self.meta['blocks']]
+        return _snapshot_values(self.meta['kind'], self.meta['dtype'], blocks, self.swap)
+
+    def __len__(self):
+        return self.meta['length']
+
+
+def _write_snapshot(df, f, allow_pickle):
+    columns, blocks, offset = [], [], 0
+    for idx, name in enumerate(df._columns):
+        values = df._column(idx)
+        kind, column_blocks = _snapshot_blocks(values)
+        if kind.endswith('pickle') and not allow_pickle:
+            raise ValueError('Column {} holds objects that can only be pickled, '
+                             'pass allow_pickle=True to save it'.format(name))
+        meta = {'name': name, 'dtype': df._dtypes[idx], 'kind': kind, 'length': len(values), 'blocks': []}
+        for block in column_blocks:
+            meta['blocks'].append([offset, len(block)])
+            padding = -len(block) % 8
+            blocks.append(block + b'\x00'*padding)
+            offset += len(block) + padding
+        columns.append(meta)
+    header = json.dumps({'byteorder': sys.byteorder, 'index': df._index, 'columns': columns}).encode('utf-8')
+    header += b' '*(-len(header) % 8)
+    f.write(_SNAPSHOT_MAGIC)
+    f.write(struct.pack('<Q', len(header)))
+    f.write(header)
+    for block in blocks:
+        f.write(block)
+
+
+_replace = getattr(os, 'replace', os.rename) # Python 2 renames over existing files on POSIX
+
+
+def load(path, mmap=True, allow_pickle=False):
+    # With mmap columns are read from the mapped file when first used,
+    # so opening a snapshot only reads its header.
+    with open(path, 'rb') as f:
+        if mmap:
+            try:
+                import mmap as _mmap
+                source = _mmap.mmap(f.fileno(), 0, access=_mmap.ACCESS_READ)
+            except (ImportError, ValueError, EnvironmentError): # No mmap, or an empty file
+                source = f.read()
+        else:
+            source = f.read()
+    if source[:8] != _SNAPSHOT_MAGIC:
+        raise ValueError('{} is not an mframe snapshot'.format(path))
+    length, = struct.unpack('<Q', bytes(source[8:16]))
+    header = json.loads(bytes(source[16:16 + length]).decode('utf-8'))
+    base, swap = 16 + length, header['byteorder'] != sys.byteorder
+    for meta in header['columns']:
+        if meta['kind'].endswith('pickle') and not allow_pickle:
+            raise ValueError('Column {} of {} is pickled, loading it can run arbitrary code. '
+                             'Pass allow_pickle=True if you trust the file'.format(meta['name'], path))
+    _values, columns, dtypes = [], [], []
+    for meta in header['columns']:
+        column = _Mapped(source, meta, base, swap)
+        _values.append(column if mmap else column.materialize())
+        columns.append(_native(meta['name']))
+        dtypes.append(_native(meta['dtype']))
+    return DataFrame._new(columns, _values, dtypes, _native(header['index']))
+
+
+_timer = getattr(time, 'perf_counter', time.time)
+
+# Classes and module functions wrapped by the profiler, the classes'
+# public methods and these operators
+_PROFILED_CLASSES = (DataFrame, Series, Mask, GroupBy, Rolling, LazyFrame)
+_PROFILED_FUNCTIONS = ['read_csv', 'load']
+_PROFILED_DUNDERS = set([
+    '__init__', '__getitem__', '__setitem__', '__round__', '__abs__', '__invert__',
+    '__eq__', '__ge__', '__gt__', '__le__', '__lt__', '__and__', '__or__', '__xor__',
+    '__add__', '__sub__', '__mul__', '__div__', '__truediv__',
+    '__radd__', '__rsub__', '__rmul__', '__rdiv__', '__rtruediv__',
+])
+
+
+def _nbytes(data):
+    # Estimated size of column storage, list slots count as pointers
+    if isinstance(data, DataFrame):
+        return sum(_nbytes(values) for values in data._values)
+    if isinstance(data, Mask):
+        return (data.size + 7) // 8
+    if isinstance(data, Series):
+        return _nbytes(data.data)
+    if isinstance(data, _Selection):
+        return 8*len(data.positions)
+    if isinstance(data, _Mapped):
+        return 0 # Still in the file
+    if isinstance(data, _Codes):
+        return _nbytes(data.codes) + 8*len(data.table)
+    if isinstance(data, array):
+        return data.itemsize*len(data)
+    return 8*len(data)
+
+
+def _rows(obj):
+    if isinstance(obj, (DataFrame, Series)):
+        return len(obj)
+    if isinstance(obj, GroupBy):
+        return len(obj.df)
+    if isinstance(obj, Rolling):
+        return len(obj.values)
+    if isinstance(obj, LazyFrame):
+        return len(obj._df)
+    return 0
+
+
+class ProfileEvent(object):
+    __slots__ = ['op', 'seconds', 'rows_in', 'rows_out', 'nbytes']
+
+    def __init__(self, op, seconds, rows_in, rows_out, nbytes):
+        self.op = op
+        self.seconds = seconds
+        self.rows_in = rows_in
+        self.rows_out = rows_out
+        self.nbytes = nbytes
+
+    def __repr__(self):
+        return 'ProfileEvent({}, {:.6f}s, {} -> {} rows, {} bytes)'.format(
+            self.op, self.seconds, self.rows_in, self.rows_out, self.nbytes)
+
+
+class _Profiler(object):
+    # Opt-in instrumentation. enable() swaps the public operations and readers
+    # for timing wrappers and disable() puts the originals back,
+    # so nothing is paid while it is off. Only the outermost call is recorded,
+    # operations mframe runs internally are part of their caller's time.
+    # Bytes are estimated from the storage of the frame or series returned.
+    # Nesting is tracked per thread, threaded partitions are each outermost.
+    def __init__(self):
+        self.enabled = False
+        self.stats = {}
+        self._callbacks = []
+        self._originals = []
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def enable(self):
+        if self.enabled:
+            return
+        for cls in _PROFILED_CLASSES:
+            for name, attr in list(vars(cls).items()):
+                if name.startswith('_') and name not in _PROFILED_DUNDERS:
+                    continue
+                op = '{}.{}'.format(cls.__name__, name)
+                if isinstance(attr, classmethod):
+                    wrapped = classmethod(self._wrap(op, attr.__func__, False))
+                elif isinstance(attr, types.FunctionType):
+                    wrapped = self._wrap(op, attr, name != '__init__')
+                else:
+                    continue
+                self._originals.append((cls, name, attr))
+                setattr(cls, name, wrapped)
+        module = sys.modules[__name__]
+        for name in _PROFILED_FUNCTIONS:
+            fn = getattr(module, name)
+            self._originals.append((module, name, fn))
+            setattr(module, name, self._wrap(name, fn, False))
+        self.enabled = True
+
+    def disable(self):
+        for cls, name, attr in reversed(self._originals):
+            setattr(cls, name, attr)
+        self._originals = []
+        self.enabled = False
+
+    def reset(self):
+        self.stats = {}
+
+    def add_callback(self, fn):
+        self._callbacks.append(fn)
+
+    def remove_callback(self, fn):
+        self._callbacks.remove(fn)
+
+    def _wrap(self, op, fn, sized):
+        profiler = self
+
+        def wrapper(obj, *args, **kwargs):
+            local = profiler._local
+            if getattr(local, 'depth', 0):
+                return fn(obj, *args, **kwargs)
+            rows_in = _rows(obj) if sized else 0
+            local.depth = 1
+            start = _timer()
+            try:
+                result = fn(obj, *args, **kwargs)
+            finally:
+                local.depth = 0
+            seconds = _timer() - start
+            if isinstance(result, (DataFrame, Series)):
+                rows_out, nbytes = len(result), _nbytes(result)
+            else: # In place, or __init__ which fills obj
+                rows_out = _rows(obj)
+                nbytes = _nbytes(obj) if not sized and isinstance(obj, (DataFrame, Series)) else 0
+            profiler._record(ProfileEvent(op, seconds, rows_in, rows_out, nbytes))
+            return result
+        wrapper.__name__ = fn.__name__
+        wrapper.__doc__ = fn.__doc__
+        return wrapper
+
+    def _record(self, event):
+        with self._lock:
+            stats = self.stats.get(event.op)
+            if stats is None:
+                stats = self.stats[event.op] = {'calls': 0, 'seconds': 0.0, 'rows_in': 0, 'rows_out': 0, 'bytes': 0}
+            stats['calls'] += 1
+            stats['seconds'] += event.seconds
+            stats['rows_in'] += event.rows_in
+            stats['rows_out'] += event.rows_out
+            stats['bytes'] += event.nbytes
+        for fn in self._callbacks:
+            fn(event)
+
+    def report(self, out=None):
+        out = out or sys.stdout
+        header = ('operation', 'calls', 'total s', 'mean ms', 'rows in', 'rows out', 'bytes')
+        rows = [header]
+        for op, stats in sorted(self.stats.items(), key=lambda item: -item[1]['seconds']):
+            rows.append((op, str(stats['calls']), '{:.4f}'.format(stats['seconds']),
+                         '{:.3f}'.format(1000*stats['seconds']/stats['calls']),
+                         str(stats['rows_in']), str(stats['rows_out']), str(stats['bytes'])))
+        widths = [max(len(row[i]) for row in rows) for i in range(len(header))]
+        for row in rows:
+            cells = [row[0].ljust(widths[0])] + [cell.rjust(width) for cell, width in zip(row[1:], widths[1:])]
+            out.write('  '.join(cells) + '\n')
+
+
+profiling = _Profiler()
@@ -1,7 +1,27 @@
 import unittest
-from mframe import DataFrame, Series, parse_date, IS_JYTHON
+from array import array
+import mframe
+from mframe import DataFrame, Series, Mask, profiling, parse_date, parse_dates, read_csv, iter_csv, load, IS_JYTHON
 import datetime as dt
+import math
+import os
+import shutil
+import tempfile
+import threading
 import time
+import warnings
+try:
+    from StringIO import StringIO
+except ImportError: # Python 3
+    from io import StringIO
+try:
+    import pandas
+except ImportError: # Optional, Jython and minimal installs
+    pandas = None
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 
 def jython_only(f):
@@ -27,6 +47,11 @@ def str_to_java_date(s):
     return SimpleDateFormat('yyy-MM-dd').parse(s)
 
 
+def enrich(df): # Module level so process pools can pickle it
+    df['total'] = df.price * df.qty
+    return df[df.qty > 1]
+
+
 tickers = {
     'tick': [
         'aapl', 'goog', 'msft',
@@ -203,6 +228,86 @@ class TestSeries(unittest.TestCase):
         self.assertEqual([2.1]*10, round(s1, 1))
 
 
+class TestSeriesDtypes(unittest.TestCase):
+    def test_inference(self):
+        self.assertEqual('int64', Series([1, 2, 3]).dtype)
+        self.assertEqual('float64', Series([1.5, 2.5]).dtype)
+        self.assertEqual('bool', Series([True, False]).dtype)
+        self.assertEqual('object', Series([1, 2.5]).dtype)
+        self.assertEqual('object', Series(['a', 1]).dtype)
+        self.assertEqual('object', Series([1, None]).dtype)
+        self.assertEqual('object', Series([2**70]).dtype)
+        self.assertEqual('object', Series([]).dtype)
+        self.assertEqual('datetime', Series([dt.datetime(2019, 1, 1)]).dtype)
+
+    def test_storage(self):
+        self.assertIsInstance(Series([1, 2, 3]).data, array)
+        self.assertIsInstance(Series([1.5, 2.5]).data, array)
+        self.assertIsInstance(Series([True, False]).data, array)
+        self.assertIsInstance(Series(['a', 'b']).data, list)
+        # Booleans are stored as bytes but come back as bools
+        s = Series([True, False])
+        self.assertIs(True, s[0])
+        self.assertIs(False, list(s)[1])
+        self.assertEqual([True, False], s.tolist())
+        self.assertEqual('[True, False]', repr(s))
+
+    def test_missing_datetimes(self):
+        # Missing dates don't stop a column from being stored as epochs
+        jan1, jan2 = dt.datetime(2019, 1, 1), dt.datetime(2019, 1, 2)
+        s = Series([None, jan2, jan1])
+        self.assertEqual('datetime', s.dtype)
+        self.assertIsInstance(s.data, array)
+        self.assertListEqual([None, jan2, jan1], s.tolist())
+        self.assertIsNone(s[0])
+        self.assertListEqual([False, True, False], list(s > '2019-01-01'))
+        self.assertListEqual([False, False, True], list(s == jan1))
+        self.assertListEqual([True, True, False], list(s != jan1))
+        self.assertListEqual([jan1, jan2, None], s.sort_values().tolist())
+        self.assertListEqual([jan2, jan1, None], s.sort_values(ascending=False).tolist())
+        self.assertEqual(jan1, s.min())
+        self.assertEqual(jan2, s.max())
+        self.assertIsNone(Series([None, None]).astype('datetime').min())
+        df = DataFrame({'d': [jan1, jan2], 'n': [1, 2]})
+        df.set(df.n == 1, 'd', None)
+        self.assertIsInstance(df.d.data, array)
+        self.assertListEqual([None, jan2], df.d.tolist())
+        self.assertListEqual([2, 1], list(df.sort_values('d').n))
+
+    def test_preserved_through_operations(self):
+        s = Series([1, 2, 3])
+        self.assertEqual('int64', (s + 1).dtype)
+        self.assertEqual('int64', (s * s).dtype)
+        self.assertEqual('float64', (s / 2).dtype)
+        self.assertEqual('float64', (s + 0.5).dtype)
+        self.assertEqual('float64', (1.5 - s).dtype)
+        self.assertEqual('int64', abs(s).dtype)
+        self.assertEqual('object', (s + [0.5, 1, 2]).dtype)
+        self.assertEqual('bool', (s > 1).dtype)
+        self.assertEqual([False, True, True], list(s > 1))
+        self.assertEqual('bool', ((s > 1) & (s < 3)).dtype)
+        self.assertEqual('float64', s.apply(float).dtype)
+        self.assertEqual('object', s.apply(str).dtype)
+        self.assertEqual([2**70, 2**70 + 1], list(Series([2**70 - 1, 2**70]) + 1))
+
+    def test_dataframe_columns(self):
+        df = DataFrame({'a': [1, 2, 3], 'b': [0.5, 1.5, 2.5], 'c': ['x', 'y', 'z']})
+        self.assertEqual('int64', df.a.dtype)
+        self.assertEqual('float64', df.b.dtype)
+        self.assertEqual('object', df.c.dtype)
+        self.assertEqual({'a': [2], 'b': [1.5], 'c': ['y']}, df[df.a == 2].to_dict())
+        self.assertEqual('int64', df[df.a == 2].a.dtype)
+        df['a'] = None
+        self.assertEqual('object', df.a.dtype)
+        df['d'] = df.b > 1
+        self.assertEqual('bool', df.d.dtype)
+        self.assertEqual([False, True, True], df.to_dict()['d'])
+        self.assertEqual(
+            {'a': None, 'b': 0.5, 'c': 'x', 'd': False},
+            next(df.iterrows()),
+        )
+
+
 class TestDataFrame(unittest.TestCase):
     def setUp(self):
         self.df = DataFrame(tickers)
@@ -220,6 +325,32 @@ class TestDataFrame(unittest.TestCase):
             df.price[7],
         )        
 
+    def test_from_rows(self):
+        rows = (tuple(row[c] for c in ['tick', 'price']) for row in self.df.iterrows())
+        df = DataFrame.from_rows(rows, columns=['tick', 'price'])
+        self.assertListEqual(['tick', 'price'], df._columns)
+        self.assertListEqual(list(self.df.price), list(df.price))
+        self.assertEqual(0, len(DataFrame.from_rows([], columns=['a'])))
+        try:
+            DataFrame.from_rows([(1, 2), (3,)], columns=['a', 'b'])
+            self.fail('Should have raised a ValueError')
+        except ValueError:
+            pass
+
+    def test_from_records(self):
+        records = iter([{'a': 1, 'b': 'x'}, {'a': 2, 'c': 2.5}, {'a': 3, 'b': 'z', 'c': 1.5, 'd': True}])
+        df = DataFrame.from_records(records, infer_rows=2)
+        self.assertListEqual(['a', 'b', 'c'], df._columns)
+        self.assertEqual('int64', df.a.dtype)
+        self.assertListEqual(['x', None, 'z'], list(df.b))
+        self.assertListEqual([None, 2.5, 1.5], list(df.c))
+
+        df = DataFrame.from_records(records, columns=['a'])
+        self.assertEqual(0, len(df))
+        df = DataFrame.from_records([{'a': 1}, {'b': 2}], columns=['b'], fill_value=0)
+        self.assertListEqual([0, 2], list(df.b))
+        self.assertEqual('int64', df.b.dtype)
+
     def test_apply(self):
         for date in self.df.get('date'):
             self.assertIsInstance(date, str)
@@ -268,6 +399,40 @@ class TestDataFrame(unittest.TestCase):
         self.assertEqual('aapl', rows[0]['tick'])
         self.assertEqual('msft', rows[5]['tick'])
 
+    def test_iterrows_reuse(self):
+        rows = [(row['tick'], row.position) for row in self.pdf.iterrows(reuse=True)]
+        self.assertListEqual([(row['tick'], row['position']) for row in self.pdf.iterrows()], rows)
+        row = next(self.pdf.iterrows(reuse=True))
+        self.assertEqual(next(self.pdf.iterrows()), row.to_dict())
+        self.assertIn('tick', row)
+        self.assertIsNone(row.get('missing'))
+        self.assertRaises(KeyError, lambda: row['missing'])
+        self.assertRaises(AttributeError, lambda: row.missing)
+
+    def test_itertuples(self):
+        df = DataFrame.from_rows([('aapl', 1.5, dt.datetime(2019, 1, 1)), ('goog', 2.5, dt.datetime(2019, 1, 2))],
+                                 ['tick', 'price', 'date'])
+        rows = list(df.itertuples())
+        self.assertEqual('aapl', rows[0].tick)
+        self.assertEqual(2.5, rows[1].price)
+        self.assertEqual(dt.datetime(2019, 1, 2), rows[1].date)
+        self.assertEqual('Row', type(rows[0]).__name__)
+        self.assertListEqual([('aapl', 1.5, dt.datetime(2019, 1, 1)), ('goog', 2.5, dt.datetime(2019, 1, 2))],
+                             list(df.itertuples(name=None)))
+        odd = DataFrame.from_rows([(1, 2)], ['my col', 'class'])
+        self.assertEqual((1, 2), tuple(next(odd.itertuples('Odd'))))
+
+    def test_iterbatches(self):
+        df = DataFrame.from_rows([(i, str(i)) for i in range(10)], ['n', 's'])
+        batches = list(df.iterbatches(4))
+        self.assertListEqual([4, 4, 2], [len(batch) for batch in batches])
+        self.assertListEqual([8, 9], list(batches[2].n))
+        self.assertListEqual(['4', '5', '6', '7'], list(batches[1].s))
+        self.assertEqual('int64', batches[0].n.dtype)
+        batches[0].set('all', 'n', 0)
+        self.assertListEqual([0, 1, 2, 3], list(df.n)[:4])
+        self.assertListEqual([], list(DataFrame.from_rows([], ['n']).iterbatches(4)))
+
     def test_sum(self):
         self.df['price'] = self.df.price.apply(float)
         self.assertEqual(1631.12, sum(self.df.get('price')))
@@ -333,6 +498,41 @@ class TestDataFrameSugar(unittest.TestCase):
             list(df['date']),
         )
 
+    def test_filter_columns(self):
+        df = self.df[self.df['tick'] == 'goog']
+        self.assertListEqual(list(self.df.to_dict().keys()), list(df.to_dict().keys()))
+        self.assertListEqual([123, 125, 124, '123', 123.50, 122.50], list(df['price']))
+        df.set('all', 'price', 0)
+        self.assertEqual(123, self.df['price'][1])
+        self.assertEqual(0, len(self.df[self.df['tick'] == 'ibm']))
+
+    def test_view(self):
+        view = self.df.view(self.df['date'] >= '2019-01-03')
+        self.assertEqual(12, len(view))
+        # Columns share the parent lists until they are accessed
+        price = self.df._columns.index('price')
+        self.assertIs(self.df._values[price], view._values[price].values)
+        self.assertListEqual(['aapl', 'goog', 'msft']*4, list(view.tick))
+
+        # Chained views look rows up in the original parent
+        view = view.view(view['tick'] == 'goog')
+        self.assertIs(self.df._values[price], view._values[price].values)
+        self.assertListEqual([124, '123', 123.50, 122.50], list(view.price))
+
+        view.set(view['date'] == '2019-01-04', 'price', 0)
+        self.assertListEqual([124, 0, 123.50, 122.50], list(view.price))
+        self.assertEqual('123', self.df['price'][10])
+
+        filtered = view[view['date'] > '2019-01-04']
+        self.assertListEqual(['2019-01-05', '2019-01-06'], list(filtered.date))
+        view.drop(view['date'] == '2019-01-03')
+        self.assertListEqual([0, 123.50, 122.50], list(view.price))
+        self.assertListEqual(['2019-01-04', '2019-01-05', '2019-01-06'], list(view.date))
+        self.assertEqual(
+            [{'tick': 'goog', 'date': '2019-01-04', 'price': 0}],
+            list(view.view([True, False, False]).iterrows()),
+        )
+
     def test_drop(self):
         results = self.df['date'] == '2019-01-02'
         self.assertEqual(18, len(self.df))
@@ -404,6 +604,30 @@ class TestTimeSeries(unittest.TestCase):
         except TypeError:
             pass
 
+    def test_parse_dates(self):
+        dates = [
+            '2019-06-26', '2019-06-27', '2019-26-06', '2019-06-28',
+            '26-06-2019', '2019-6-29', '2019-06-26T10:54:55',
+            '2019-06-26T10:54:55Z', '20190626T105455Z', '2019-01-01 00:00:00',
+            dt.datetime(2019, 1, 1), '2019-01-02',
+        ]
+        self.assertListEqual([parse_date(d) for d in dates], parse_dates(dates))
+        self.assertEqual(dt.datetime(2019, 6, 27), parse_dates(['2019-27-06', '2019-06-27'])[1])
+        self.assertEqual(dt.datetime(2019, 6, 26, 10, 54, 55), parse_date('2019-06-26 10:54:55'))
+        for bad in ['2019-06-26 10:54:55Z', '2019-02-30', '31-31-31', 20190101]:
+            try:
+                parse_dates(['2019-01-01', bad])
+                self.fail('Should have raised a TypeError for {}'.format(bad))
+            except TypeError:
+                pass
+
+    def test_parse_dates_cache(self):
+        import mframe
+        parse_dates(['2019-01-{:02d}'.format(d) for d in range(1, 29)] * 2)
+        self.assertIn('2019-01-28', mframe._DATE_CACHE)
+        parse_dates(['{}-01-01'.format(year) for year in range(1000, 1000 + mframe._DATE_CACHE_SIZE + 1)])
+        self.assertTrue(len(mframe._DATE_CACHE) <= mframe._DATE_CACHE_SIZE)
+
 
     def test_filter_with_string_dates(self):
         d3 = dt.datetime(2019, 1, 3, 0, 0)
@@ -418,11 +642,48 @@ class TestTimeSeries(unittest.TestCase):
             list(df['date']),
         )
 
+    def test_epoch_storage(self):
+        self.assertEqual('datetime', self.df['date'].dtype)
+        self.assertIsInstance(self.df['date'].data, array)
+        self.assertEqual(dt.datetime(2019, 1, 2), self.df['date'][3])
+        self.assertEqual(dt.datetime(2019, 1, 2), self.df.to_dict()['date'][3])
+        self.assertIsInstance(next(self.df.iterrows())['date'], dt.datetime)
+        self.assertEqual(dt.datetime(2019, 1, 1), self.df['date'].min())
+        self.assertEqual(dt.datetime(2019, 1, 6), self.df['date'].max())
+
+        dates = [dt.datetime(1969, 12, 31, 23, 59, 59, 999999), dt.datetime(2262, 4, 11, 0, 0, 0, 1)]
+        self.assertListEqual(dates, list(Series(dates)))
+
+    def test_epoch_comparisons(self):
+        dates = self.df['date']
+        self.assertListEqual([False]*3 + [True]*3 + [False]*12, list(dates == '2019-01-02'))
+        self.assertListEqual([True]*9 + [False]*9, list(dates < dt.datetime(2019, 1, 4)))
+        self.assertEqual('bool', (dates > '2019-01-01T12:00:00').dtype)
+
+    def test_unencoded_datetimes(self):
+        class UTC(dt.tzinfo):
+            def utcoffset(self, d):
+                return dt.timedelta(0)
+        aware = Series([dt.datetime(2019, 1, 1, tzinfo=UTC()), dt.datetime(2019, 1, 2, tzinfo=UTC())])
+        self.assertEqual('datetime', aware.dtype)
+        self.assertIsInstance(aware.data, list)
+        missing = Series([dt.datetime(2019, 1, 1), None])
+        self.assertEqual('datetime', missing.dtype)
+        self.assertIsInstance(missing.data, array)
+        self.assertListEqual([dt.datetime(2019, 1, 1), None], list(missing))
+
 
 class TestJavaTimeSeries(unittest.TestCase):
     def setUp(self):
         self.df = DataFrame(tickers)
 
+    @jython_only
+    def test_java_dates_stored_as_epochs(self):
+        from java.util import GregorianCalendar
+        dates = Series([GregorianCalendar(2019, 0, 2).getTime(), None])
+        self.assertIsInstance(dates.data, array)
+        self.assertListEqual([dt.datetime(2019, 1, 2), None], dates.tolist())
+
     @jython_only
     def test_filter_with_java_date(self):
         from java.util import GregorianCalendar, Calendar
@@ -618,6 +879,1012 @@ class TestPivot(unittest.TestCase):
         missing_price = df[(df.date == '2019-01-02') & (df.tick == 'goog')].price_close[0]
         self.assertEqual(missing_price, 0)
 
+    def test_pivot_table_aggfunc(self):
+        df = DataFrame({
+            'tick': ['aapl', 'aapl', 'aapl', 'goog', 'goog'],
+            'time': ['open', 'open', 'close', 'open', 'open'],
+            'price': [1, 3, 5, 7, 9],
+        })
+        first = df.pivot_table(index=['tick'], values=['price'], columns=['time'])
+        self.assertListEqual(['aapl', 'goog'], list(first.tick))
+        self.assertListEqual([1, 7], list(first.price_open))
+        self.assertListEqual([5, None], list(first.price_close))
+
+        for aggfunc, expected in [('sum', [4, 16]), ('mean', [2.0, 8.0]), ('count', [2, 2]),
+                                  ('min', [1, 7]), ('max', [3, 9]), ('last', [3, 9]),
+                                  (lambda values: values[-1] - values[0], [2, 2])]:
+            table = df.pivot_table(index=['tick'], values=['price'], columns=['time'],
+                                   fill_value=0, aggfunc=aggfunc)
+            self.assertListEqual(expected, list(table.price_open))
+        self.assertListEqual([0, 0], list(table.price_close))
+
+        try:
+            df.pivot_table(index=['tick'], values=['price'], columns=['time'], aggfunc='median')
+            self.fail('Should have raised a ValueError')
+        except ValueError:
+            pass
+
+
+class TestGroupBy(unittest.TestCase):
+    def setUp(self):
+        self.df = DataFrame(ohlc)
+
+    def test_agg(self):
+        df = self.df.groupby('tick').agg({'price': 'count', 'qty': ['min', 'max', 'first', 'last']})
+        self.assertListEqual(['aapl', 'goog', 'msft'], list(df.tick))
+        self.assertListEqual([24, 23, 24], list(df.price))
+        self.assertListEqual([45.67]*3, list(df.qty_min))
+        self.assertListEqual([123]*3, list(df.qty_max))
+        self.assertListEqual([100]*3, list(df.qty_first))
+        self.assertListEqual([100]*3, list(df.qty_last))
+
+    def test_agg_multiple_keys(self):
+        df = self.df.groupby(['date', 'tick']).agg({'price': ['sum', 'mean']})
+        self.assertEqual(18, len(df))
+        goog = df[(df.date == '2019-01-02') & (df.tick == 'goog')]
+        self.assertAlmostEqual(268.67, goog.price_sum[0])
+        self.assertAlmostEqual(268.67 / 3, goog.price_mean[0])
+
+    def test_agg_custom(self):
+        def spread(values):
+            return max(values) - min(values)
+        df = self.df.groupby('time').agg({'price': spread, 'qty': [spread]})
+        self.assertListEqual(['open', 'high', 'low', 'close'], list(df.time))
+        self.assertListEqual([0]*4, list(df.price))
+        self.assertListEqual([0]*4, list(df.qty_spread))
+
+    def test_unknown_aggregation(self):
+        try:
+            self.df.groupby('tick').agg({'price': 'median'})
+            self.fail('Should have raised a ValueError')
+        except ValueError:
+            pass
+
+
+class TestSort(unittest.TestCase):
+    def setUp(self):
+        self.df = DataFrame({
+            'tick': ['msft', 'aapl', 'goog', 'aapl', 'msft', 'goog'],
+            'price': [3.5, 2.5, float('nan'), 1.5, 3.5, 0.5],
+            'qty': [1, 2, 3, 4, 5, 6],
+            'note': ['b', None, 'a', 'c', None, 'a'],
+        })
+
+    def test_argsort(self):
+        s = Series([3, 1, 2, 1])
+        self.assertListEqual([1, 3, 2, 0], list(s.argsort()))
+        self.assertListEqual([0, 2, 1, 3], list(s.argsort(ascending=False)))
+        self.assertEqual('int64', s.argsort().dtype)
+        self.assertListEqual([1, 1, 2, 3], list(s.sort_values()))
+        self.assertListEqual([2, 5, 0, 3, 1, 4], list(self.df.note.argsort()))
+        self.assertListEqual([3, 0, 2, 5, 1, 4], list(self.df.note.argsort(ascending=False)))
+        dates = Series([dt.datetime(2019, 1, 3), dt.datetime(2019, 1, 1), dt.datetime(2019, 1, 2)])
+        self.assertListEqual([dt.datetime(2019, 1, d) for d in (1, 2, 3)], list(dates.sort_values()))
+
+    def test_sort_values(self):
+        df = self.df.sort_values('price')
+        self.assertListEqual([6, 4, 2, 1, 5, 3], list(df.qty))
+        df = self.df.sort_values('price', ascending=False)
+        self.assertListEqual([1, 5, 2, 4, 6, 3], list(df.qty))
+        self.assertEqual('float64', df.price.dtype)
+
+    def test_sort_multiple_keys(self):
+        df = self.df.sort_values(['tick', 'qty'], ascending=[True, False])
+        self.assertListEqual(['aapl', 'aapl', 'goog', 'goog', 'msft', 'msft'], list(df.tick))
+        self.assertListEqual([4, 2, 6, 3, 5, 1], list(df.qty))
+        df = self.df.sort_values(['note', 'tick'])
+        self.assertListEqual([3, 6, 1, 4, 2, 5], list(df.qty))
+
+    def test_take(self):
+        order = self.df.tick.argsort()
+        other = DataFrame({'n': list(range(6))})
+        self.assertListEqual([1, 3, 2, 5, 0, 4], list(other.take(order).n))
+        self.assertListEqual(list(self.df.sort_values('tick').qty), list(self.df.take(order).qty))
+        self.assertListEqual([6, 6], list(self.df.take([-1, 5]).qty))
+
+
+class TestIndex(unittest.TestCase):
+    def setUp(self):
+        self.df = DataFrame({
+            'id': [10, 20, 30, 20],
+            'tick': ['msft', 'aapl', 'goog', 'ibm'],
+            'qty': [1, 2, 3, 4],
+        })
+
+    def test_loc(self):
+        df = self.df.set_index('id')
+        self.assertListEqual(['goog'], list(df.loc[30].tick))
+        self.assertListEqual(['aapl', 'ibm'], list(df.loc[20].tick))
+        self.assertListEqual([1, 2, 4], list(df.loc[[10, 20]].qty))
+        self.assertRaises(KeyError, lambda: df.loc[40])
+        self.assertRaises(KeyError, self.df.set_index, 'missing')
+
+    def test_loc_without_index(self):
+        self.assertListEqual(['goog'], list(self.df.loc[2].tick))
+        self.assertListEqual(['ibm'], list(self.df.loc[-1].tick))
+
+    def test_index_maintenance(self):
+        df = self.df.set_index('tick')
+        self.assertListEqual([2], list(df.loc['aapl'].qty))
+        df.set([True, False, False, False], 'qty', 9)
+        self.assertListEqual([9], list(df.loc['msft'].qty))
+        df.set([False, True, False, False], 'tick', 'nflx')
+        self.assertListEqual([2], list(df.loc['nflx'].qty))
+        self.assertRaises(KeyError, lambda: df.loc['aapl'])
+        df.drop([True, False, False, False])
+        self.assertListEqual([3], list(df.loc['goog'].qty))
+        self.assertListEqual([4], list(df[df.qty > 3].loc['ibm'].qty))
+        self.assertListEqual([2], list(df.reset_index().loc[0].qty))
+
+
+class TestMask(unittest.TestCase):
+    def setUp(self):
+        self.s = Series([1, 2, 3, 4, 5])
+
+    def test_operators(self):
+        gt, lt = self.s > 2, self.s < 5
+        self.assertIsInstance(gt, Mask)
+        self.assertListEqual([False, False, True, True, False], list(gt & lt))
+        self.assertListEqual([True, True, True, True, True], list(gt | lt))
+        self.assertListEqual([True, True, False, False, True], list(gt ^ lt))
+        self.assertListEqual([True, True, False, False, False], list(~gt))
+        self.assertListEqual([False, False, True, False, False], list(gt & [True, False, True, False, False]))
+        self.assertListEqual([True, False, True, True, True], list([True, False, False, False, False] | gt))
+        self.assertListEqual([True, True, False, False, False], list(~Series([False, False, True, True, True])))
+
+    def test_reductions(self):
+        gt = self.s > 2
+        self.assertEqual(3, gt.sum())
+        self.assertTrue(gt.any())
+        self.assertFalse(gt.all())
+        self.assertTrue((self.s > 0).all())
+        self.assertFalse((self.s > 5).any())
+        self.assertEqual(0, (self.s > 5).sum())
+
+    def test_access(self):
+        gt = self.s > 2
+        self.assertEqual(5, len(gt))
+        self.assertEqual('bool', gt.dtype)
+        self.assertTrue(gt[2])
+        self.assertFalse(gt[0])
+        self.assertTrue(gt[-1])
+        self.assertListEqual([True, True], gt[3:])
+        self.assertListEqual([2, 3, 4], gt.positions())
+        self.assertRaises(IndexError, lambda: gt[5])
+        self.assertEqual(0, len(Series([]) > 1))
+
+    def test_series_methods(self):
+        gt = self.s > 2
+        self.assertListEqual([0, 0, 1, 1, 1], gt.apply(int).tolist())
+        self.assertEqual('int64', gt.apply(int).dtype)
+        self.assertListEqual([False, False, True, True, True], list(gt))
+        self.assertListEqual([0, 0, 1, 1, 1], list(gt.__round__(0)))
+
+    def test_from_flags(self):
+        mask = Mask([True, False, 1, 0, 'x'])
+        self.assertListEqual([True, False, True, False, True], list(mask))
+        self.assertListEqual([0, 2, 4], mask.positions())
+        self.assertListEqual([False, True], list(~Mask([True, False])))
+        self.assertEqual(0, len(Mask([])))
+
+    def test_set_with_longer_mask(self):
+        df = DataFrame({'a': [1, 2, 3], 'b': list('abc')})
+        mask = Mask([False, True, True, True, True])
+        df.set(mask, 'a', 0)
+        df.set(mask, 'b', 'z')
+        df.set(mask, 'c', 1.5)
+        self.assertListEqual([1, 0, 0], list(df.a))
+        self.assertListEqual(['a', 'z', 'z'], list(df.b))
+        self.assertListEqual([None, 1.5, 1.5], list(df.c))
+        self.assertEqual(3, len(df))
+
+    def test_frame_masks(self):
+        df = DataFrame({'a': [1, 2, 3, 4, 5], 'b': list('abcde')})
+        self.assertListEqual(['a', 'e'], list(df[(df.a < 2) | (df.a > 4)].b))
+        self.assertListEqual(['b', 'c', 'd'], list(df.view(~((df.a < 2) | (df.a > 4))).b))
+        df.set(df.a > 3, 'b', 'z')
+        self.assertListEqual(['a', 'b', 'c', 'z', 'z'], list(df.b))
+        df.set([df.a > 1, df.a < 4], 'b', 'y')
+        self.assertListEqual(['a', 'y', 'y', 'z', 'z'], list(df.b))
+        df.drop(df.b == 'y')
+        self.assertListEqual([1, 4, 5], list(df.a))
+
+
+class TestCopyOnWrite(unittest.TestCase):
+    def setUp(self):
+        self.tick = ['msft', 'aapl', 'goog']
+        self.df = DataFrame({'tick': self.tick, 'qty': [1, 2, 3]})
+
+    def test_input_buffers(self):
+        self.df.set([True, False, False], 'tick', 'ibm')
+        self.assertListEqual(['ibm', 'aapl', 'goog'], list(self.df.tick))
+        self.assertListEqual(['msft', 'aapl', 'goog'], self.tick)
+
+    def test_series(self):
+        tick = self.df.tick
+        self.df.set([False, True, False], 'tick', 'ibm')
+        self.df.set([False, True, False], 'tick', 'nflx')
+        self.assertListEqual(['msft', 'aapl', 'goog'], list(tick))
+        self.assertListEqual(['msft', 'nflx', 'goog'], list(self.df.tick))
+        selected = self.df[['tick']]
+        self.df.set('all', 'tick', 'x')
+        self.assertListEqual(['msft', 'nflx', 'goog'], list(selected.tick))
+
+    def test_shallow_copy(self):
+        other = self.df.copy()
+        other.set([True, False, False], 'tick', 'ibm')
+        other.drop([False, False, True])
+        self.assertListEqual(['ibm', 'aapl'], list(other.tick))
+        self.assertListEqual(['msft', 'aapl', 'goog'], list(self.df.tick))
+        self.df.set('all', 'qty', 0)
+        self.assertListEqual([1, 2], list(other.qty))
+        other['price'] = [1.5, 2.5]
+        self.assertNotIn('price', self.df)
+
+    def test_view(self):
+        df = DataFrame.from_rows([('msft', 1), ('aapl', 2), ('goog', 3)], ['tick', 'qty'])
+        view = df.view([True, False, True])
+        df.set([True, True, True], 'tick', 'ibm')
+        self.assertListEqual(['msft', 'goog'], list(view.tick))
+
+    def test_deep_copy(self):
+        other = self.df.copy(deep=True)
+        other.set('all', 'tick', 'ibm')
+        self.assertListEqual(['msft', 'aapl', 'goog'], list(self.df.tick))
+        self.assertListEqual([1, 2, 3], list(other.qty))
+
+
+class TestCompaction(unittest.TestCase):
+    def setUp(self):
+        self.df = DataFrame.from_rows([
+            ('msft', 1, 1.5, True, dt.datetime(2019, 1, 1)),
+            ('aapl', 2, 2.5, False, dt.datetime(2019, 1, 2)),
+            ('goog', 3, 3.5, True, dt.datetime(2019, 1, 3)),
+            ('ibm', 4, 4.5, False, dt.datetime(2019, 1, 4)),
+            ('nflx', 5, 5.5, True, dt.datetime(2019, 1, 5)),
+        ], ['tick', 'qty', 'price', 'flag', 'date'])
+
+    def test_drop_masks(self):
+        for mask in ([True, False, True, False, False],
+                     Series([True, False, True, False, False]),
+                     (self.df.qty == 1) | (self.df.qty == 3),
+                     [[True, True, True, False, False], [True, False, True, True, False]]):
+            df = self.df.copy()
+            df.drop(mask)
+            self.assertListEqual(['aapl', 'ibm', 'nflx'], list(df.tick))
+            self.assertListEqual([2, 4, 5], list(df.qty))
+            self.assertListEqual([2.5, 4.5, 5.5], list(df.price))
+            self.assertListEqual([False, False, True], list(df.flag))
+            self.assertListEqual([dt.datetime(2019, 1, d) for d in (2, 4, 5)], list(df.date))
+        self.assertEqual(5, len(self.df))
+
+    def test_drop_in_place(self):
+        # Few rows removed, the owned buffers are compacted where they are
+        df = DataFrame.from_rows([(i, str(i)) for i in range(40)], ['n', 's'])
+        buffers = list(df._values)
+        df.drop([i in (0, 3, 4, 39) for i in range(40)])
+        kept = [i for i in range(40) if i not in (0, 3, 4, 39)]
+        self.assertListEqual(kept, list(df.n))
+        self.assertListEqual([str(i) for i in kept], list(df.s))
+        self.assertEqual('int64', df.n.dtype)
+        self.assertTrue(all(a is b for a, b in zip(buffers, df._values)))
+        df.drop([False]*36)
+        self.assertEqual(36, len(df))
+        df.drop('all')
+        self.assertEqual(0, len(df))
+
+    def test_drop_gathers(self):
+        # Most rows removed, the survivors are gathered into new buffers
+        df = DataFrame.from_rows([(i, str(i), 'ab'[i % 2]) for i in range(10)], ['n', 's', 'c'])
+        df['c'] = df.c.astype('category')
+        buffers = list(df._values)
+        df.drop([i % 3 != 0 for i in range(10)])
+        self.assertListEqual([0, 3, 6, 9], list(df.n))
+        self.assertListEqual(['0', '3', '6', '9'], list(df.s))
+        self.assertListEqual(['a', 'b', 'a', 'b'], list(df.c))
+        self.assertListEqual(['int64', 'object', 'category'], df._dtypes)
+        self.assertTrue(all(a is not b for a, b in zip(buffers, df._values)))
+        self.assertListEqual(list(range(10)), list(buffers[0]))
+
+    def test_set_masks(self):
+        for mask in ([False, True, False, True, False],
+                     Series([False, True, False, True, False]),
+                     (self.df.qty == 2) | (self.df.qty == 4),
+                     [[False, True, True, True, False], [True, True, False, True, True]]):
+            df = self.df.copy()
+            df.set(mask, 'qty', 0)
+            df.set(mask, 'price', [9.5, 8.5, 7.5, 6.5, 5.5])
+            df.set(mask, 'date', dt.datetime(2020, 1, 1))
+            self.assertListEqual([1, 0, 3, 0, 5], list(df.qty))
+            self.assertEqual('int64', df.qty.dtype)
+            self.assertListEqual([1.5, 8.5, 3.5, 6.5, 5.5], list(df.price))
+            self.assertEqual(dt.datetime(2020, 1, 1), df.date[3])
+            self.assertEqual('datetime', df.date.dtype)
+        self.assertListEqual([1, 2, 3, 4, 5], list(self.df.qty))
+
+    def test_set_changes_dtype(self):
+        df = self.df.copy()
+        df.set([True, False, False, False, False], 'qty', 'one')
+        self.assertEqual('object', df.qty.dtype)
+        self.assertListEqual(['one', 2, 3, 4, 5], list(df.qty))
+        df.set([True, False, False, False, False], 'qty', 1)
+        self.assertEqual('int64', df.qty.dtype)
+        df.set([False, True, False, False, False], 'qty', 2**70)
+        self.assertListEqual([1, 2**70, 3, 4, 5], list(df.qty))
+        df.set([False, False, True, False, False], 'flag', 1)
+        self.assertEqual('object', df.flag.dtype)
+
+
+class TestProfiling(unittest.TestCase):
+    def setUp(self):
+        self.events = []
+        profiling.reset()
+        profiling.add_callback(self.events.append)
+        profiling.enable()
+
+    def tearDown(self):
+        profiling.disable()
+        profiling.remove_callback(self.events.append)
+        profiling.reset()
+
+    def test_stats(self):
+        df = DataFrame({'a': list(range(10)), 'b': ['x']*10})
+        filtered = df[df.a > 4]
+        df.drop(df.a < 2)
+        self.assertEqual(5, len(filtered))
+        self.assertListEqual(['DataFrame.__init__', 'Series.__gt__', 'DataFrame.__getitem__',
+                              'Series.__lt__', 'DataFrame.drop'], [e.op for e in self.events])
+        stats = profiling.stats['DataFrame.__getitem__']
+        self.assertEqual(1, stats['calls'])
+        self.assertEqual(10, stats['rows_in'])
+        self.assertEqual(5, stats['rows_out'])
+        self.assertTrue(stats['bytes'] > 0)
+        self.assertEqual(8, profiling.stats['DataFrame.drop']['rows_out'])
+        self.assertTrue(all(e.seconds >= 0 for e in self.events))
+
+    def test_nested_calls(self):
+        df = DataFrame.from_rows([(1, 'a'), (2, 'b')], ['n', 's'])
+        df.sort_values('n', ascending=False)
+        # sort_values runs take internally, only the outer call is recorded
+        self.assertListEqual(['DataFrame.from_rows', 'DataFrame.sort_values'], [e.op for e in self.events])
+
+    def test_threads(self):
+        # A call made by another thread while this one is inside an operation is its own
+        def scale(value):
+            worker = threading.Thread(target=lambda: Series([value]) * 2)
+            worker.start()
+            worker.join()
+            return value
+        Series([1, 2]).apply(scale)
+        self.assertEqual(1, profiling.stats['Series.apply']['calls'])
+        self.assertEqual(2, profiling.stats['Series.__mul__']['calls'])
+
+    def test_helper_classes(self):
+        df = DataFrame({'k': ['a', 'b', 'a', 'b'], 'v': [1, 2, 3, 4]})
+        del self.events[:]
+        df.groupby('k').agg({'v': 'sum'})
+        df.v.rolling(2).mean()
+        lf = df.lazy()
+        lf[lf.v > 1].collect()
+        ops = [e.op for e in self.events]
+        for op in ('GroupBy.agg', 'Rolling.mean', 'LazyFrame.collect'):
+            self.assertIn(op, ops)
+        # The frame the aggregation builds is part of its own time
+        self.assertNotIn('DataFrame.__init__', ops)
+        self.assertEqual(4, profiling.stats['GroupBy.agg']['rows_in'])
+        self.assertEqual(2, profiling.stats['GroupBy.agg']['rows_out'])
+        self.assertEqual(3, profiling.stats['LazyFrame.collect']['rows_out'])
+
+    def test_readers(self):
+        tmp = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmp, 'data.csv')
+            with open(path, 'w') as f:
+                f.write('a\n1\n2\n')
+            df = mframe.read_csv(path)
+            df.save(os.path.join(tmp, 'data.mf'))
+            mframe.load(os.path.join(tmp, 'data.mf'))
+        finally:
+            shutil.rmtree(tmp)
+        self.assertEqual(2, profiling.stats['read_csv']['rows_out'])
+        self.assertEqual(2, profiling.stats['load']['rows_out'])
+        profiling.disable()
+        self.assertEqual('read_csv', mframe.read_csv.__code__.co_name)
+
+    def test_report(self):
+        DataFrame({'a': [1, 2]}).a + 1
+        out = StringIO()
+        profiling.report(out)
+        lines = out.getvalue().splitlines()
+        self.assertTrue(lines[0].startswith('operation'))
+        self.assertEqual(3, len(lines))
+
+    def test_disable(self):
+        profiling.disable()
+        DataFrame({'a': [1, 2]}).drop([True, False])
+        self.assertListEqual([], self.events)
+        self.assertEqual('drop', DataFrame.__dict__['drop'].__code__.co_name)
+        self.assertFalse(profiling.enabled)
+
+
+class TestCategorical(unittest.TestCase):
+    def setUp(self):
+        self.df = DataFrame.from_rows([
+            ('open', 'eu', 1), ('closed', 'us', 2), ('open', 'us', 3), (None, 'eu', 4), ('open', 'eu', 5),
+        ], ['status', 'region', 'qty'])
+        self.df['status'] = self.df.status.astype('category')
+
+    def test_astype(self):
+        self.assertEqual('category', self.df.status.dtype)
+        self.assertEqual('object', self.df.region.dtype)
+        self.assertListEqual(['open', 'closed', 'open', None, 'open'], list(self.df.status))
+        self.assertEqual('closed', self.df.status[1])
+        self.assertListEqual(['closed', 'open'], self.df.status[1:3])
+        self.assertListEqual(['open', 'closed', 'open', None, 'open'], self.df.to_dict()['status'])
+        self.assertEqual('object', self.df.status.astype('object').dtype)
+        self.assertListEqual(list(self.df.status), list(self.df.status.astype('object')))
+
+    def test_comparisons(self):
+        status = self.df.status
+        self.assertListEqual([True, False, True, False, True], list(status == 'open'))
+        self.assertListEqual([False, True, False, True, False], list(status != 'open'))
+        self.assertListEqual([False, False, False, True, False], list(status == None)) # noqa: E711
+        self.assertFalse((status == 'missing').any())
+        self.assertListEqual([2], list(self.df[status.isin(['closed', 'missing'])].qty))
+        self.assertListEqual([False, True, False, True, False], list(status.isin(['closed', None])))
+        self.assertListEqual([True, False, False, True, True], list(self.df.region.isin(['eu'])))
+        self.assertListEqual([1, 3, 5], list(self.df[status == 'open'].qty))
+
+    def test_many_categories(self):
+        s = Series([str(i) for i in range(300)]).astype('category')
+        self.assertListEqual([200], (s == '200').positions())
+        self.assertListEqual([5, 299], s.isin(['5', '299', 'x']).positions())
+
+    def test_updates(self):
+        self.df.set(self.df.qty > 3, 'status', 'archived')
+        self.assertEqual('category', self.df.status.dtype)
+        self.assertListEqual(['open', 'closed', 'open', 'archived', 'archived'], list(self.df.status))
+        self.df.drop(self.df.status == 'closed')
+        self.assertListEqual(['open', 'open', 'archived', 'archived'], list(self.df.status))
+        self.assertListEqual([1, 3, 4, 5], list(self.df.qty))
+        view = self.df.view(self.df.qty > 3)
+        self.assertListEqual(['archived', 'archived'], list(view.status))
+        self.assertListEqual(['archived', 'archived', 'open', 'open'], list(self.df.sort_values('qty', False).status))
+
+    def test_grouping(self):
+        result = self.df.groupby('status').agg({'qty': 'sum'})
+        self.assertListEqual(['open', 'closed', None], list(result.status))
+        self.assertListEqual([9, 2, 4], list(result.qty))
+        table = self.df.pivot_table(index=['status'], values=['qty'], columns=['region'], aggfunc='sum')
+        self.assertListEqual(['open', 'closed', None], list(table.status))
+        self.assertListEqual([6, None, 4], list(table.qty_eu))
+        self.df['region'] = self.df.region.astype('category')
+        coded = self.df.pivot_table(index=['status'], values=['qty'], columns=['region'], aggfunc='sum')
+        self.assertEqual(table.to_dict(), coded.to_dict())
+
+
+class TestPartitions(unittest.TestCase):
+    def setUp(self):
+        self.df = DataFrame.from_rows([('t{}'.format(i), 1.5, i % 3) for i in range(20)], ['tick', 'price', 'qty'])
+        self.expected = enrich(self.df.copy(deep=True))
+
+    def test_map_partitions(self):
+        for executor in ('thread', 'process'):
+            result = self.df.map_partitions(enrich, n_workers=3, executor=executor)
+            self.assertEqual(self.expected.to_dict(), result.to_dict())
+            self.assertEqual('float64', result.total.dtype)
+        self.assertNotIn('total', self.df)
+
+    def test_map_partitions_results(self):
+        self.assertListEqual(list(self.df.qty), self.df.map_partitions(lambda df: df.qty, 4, 'thread').tolist())
+        self.assertListEqual([7, 7, 6], self.df.map_partitions(len, 3, 'thread'))
+        self.assertListEqual(list(self.df.tick), self.df.map_partitions(lambda df: list(df.tick), 3, 'thread'))
+        self.assertRaises(ValueError, self.df.map_partitions, len, 2, 'cluster')
+
+    def test_parallel_apply(self):
+        tick = self.df.tick.astype('category')
+        for executor in ('thread', 'process'):
+            self.assertListEqual([t.upper() for t in self.df.tick], list(tick.parallel_apply(str.upper, 4, executor)))
+        self.assertEqual('int64', self.df.qty.parallel_apply(abs, 3, 'thread').dtype)
+        self.assertListEqual([], list(Series([]).parallel_apply(abs, 2)))
+
+    def test_serial_fallback(self):
+        pool, mframe.futures = mframe.futures, None
+        try:
+            self.assertEqual(self.expected.to_dict(), self.df.map_partitions(enrich, n_workers=4).to_dict())
+            self.assertListEqual([2, 3], list(Series([1, 2]).parallel_apply(lambda x: x + 1)))
+        finally:
+            mframe.futures = pool
+
+
+class TestMerge(unittest.TestCase):
+    def setUp(self):
+        self.trades = DataFrame({
+            'tick': ['aapl', 'goog', 'ibm', 'aapl', 'msft'],
+            'date': ['2019-01-01', '2019-01-01', '2019-01-01', '2019-01-02', '2019-01-02'],
+            'qty': [1, 2, 3, 4, 5],
+        })
+        self.names = DataFrame({
+            'tick': ['goog', 'aapl', 'msft', 'tsla'],
+            'name': ['Alphabet', 'Apple', 'Microsoft', 'Tesla'],
+            'qty': [10, 20, 30, 40],
+        })
+
+    def test_inner(self):
+        df = self.trades.merge(self.names, on='tick')
+        self.assertListEqual(['aapl', 'goog', 'aapl', 'msft'], list(df.tick))
+        self.assertListEqual(['tick', 'date', 'qty_x', 'name', 'qty_y'], df._columns)
+        self.assertListEqual(['Apple', 'Alphabet', 'Apple', 'Microsoft'], list(df.name))
+        self.assertEqual('int64', df.qty_y.dtype)
+
+    def test_keys_stored_differently(self):
+        left = DataFrame({'d': [dt.datetime(2019, 1, 1), None, dt.datetime(2019, 1, 2)], 'l': [1, 2, 3]})
+        right = DataFrame({'d': [dt.datetime(2019, 1, 2), dt.datetime(2019, 1, 1)], 'r': ['b', 'a']})
+        df = left.merge(right, on='d')
+        self.assertListEqual([dt.datetime(2019, 1, 1), dt.datetime(2019, 1, 2)], list(df.d))
+        self.assertListEqual(['a', 'b'], list(df.r))
+        left = DataFrame({'k': ['x', 'y', 'z']})
+        left['k'] = left.k.astype('category')
+        right = DataFrame({'k': ['z', 'x'], 'r': [1, 2]})
+        right['k'] = right.k.astype('category')
+        df = left.merge(right, on='k')
+        self.assertListEqual(['x', 'z'], list(df.k))
+        self.assertListEqual([2, 1], list(df.r))
+
+    def test_build_on_smaller_left(self):
+        left = DataFrame({'k': [2, 1], 'l': ['b', 'a']})
+        right = DataFrame({'k': [1, 2, 2, 3, 1], 'r': [10, 20, 21, 30, 11]})
+        df = left.merge(right, on='k')
+        self.assertListEqual([2, 2, 1, 1], list(df.k))
+        self.assertListEqual([20, 21, 10, 11], list(df.r))
+        df = left.merge(right, on='k', how='outer')
+        self.assertListEqual([2, 2, 1, 1, 3], list(df.k))
+        self.assertListEqual(['b', 'b', 'a', 'a', None], list(df.l))
+
+    def test_left_and_outer(self):
+        df = self.trades.merge(self.names, on='tick', how='left', suffixes=('', '_ref'))
+        self.assertListEqual(['tick', 'date', 'qty', 'name', 'qty_ref'], df._columns)
+        self.assertListEqual(['Apple', 'Alphabet', None, 'Apple', 'Microsoft'], list(df.name))
+        self.assertListEqual([20, 10, None, 20, 30], list(df.qty_ref))
+        self.assertEqual('int64', df.qty.dtype)
+
+        df = self.trades.merge(self.names, on='tick', how='outer')
+        self.assertListEqual(['aapl', 'goog', 'ibm', 'aapl', 'msft', 'tsla'], list(df.tick))
+        self.assertListEqual([1, 2, 3, 4, 5, None], list(df.qty_x))
+
+    def test_multiple_keys(self):
+        prices = DataFrame({
+            'tick': ['aapl', 'aapl', 'goog'],
+            'date': ['2019-01-02', '2019-01-01', '2019-01-01'],
+            'price': [1.5, 2.5, 3.5],
+        })
+        df = self.trades.merge(prices, on=['tick', 'date'], how='left')
+        self.assertListEqual([2.5, 3.5, None, 1.5, None], list(df.price))
+        try:
+            self.trades.merge(prices, on='tick', how='cross')
+            self.fail('Should have raised a ValueError')
+        except ValueError:
+            pass
+
+
+class TestLazy(unittest.TestCase):
+    def setUp(self):
+        self.df = DataFrame(ohlc)
+
+    def test_matches_eager(self):
+        lf = self.df.lazy()
+        lf = lf[(lf.time == 'open') | (lf.time == 'close')]
+        lf['value'] = lf.price * lf.qty
+        lf = lf[lf.value > 5000]
+        lf = lf[['tick', 'value', 'time']]
+        lf.set(lf.time == 'close', 'value', 0)
+        result = lf.collect()
+
+        df = self.df[Series([t in ('open', 'close') for t in self.df.time])]
+        df['value'] = df.price * df.qty
+        df = df[df.value > 5000][['tick', 'value', 'time']]
+        df.set(df.time == 'close', 'value', 0)
+        self.assertEqual(df.to_dict(), result.to_dict())
+        self.assertListEqual(['tick', 'value', 'time'], result._columns)
+        self.assertEqual('int64', result.value.dtype)
+
+    def test_predicate_pushdown(self):
+        calls = []
+
+        def track(value):
+            calls.append(value)
+            return value
+
+        lf = self.df.lazy()
+        lf['tracked'] = lf.qty.apply(track)
+        lf = lf[lf.tick == 'goog']
+        lf = lf[lf.tracked > 100]
+        df = lf.collect()
+        self.assertEqual(23, len(calls)) # Only goog rows reach the set
+        self.assertListEqual([123]*6, list(df.tracked))
+        self.assertListEqual(['high']*6, list(df.time))
+
+    def test_column_pruning(self):
+        view = self.df.view(self.df.tick == 'aapl')
+        lf = view.lazy()
+        lf = lf[lf.time == 'high'][['date', 'time']]
+        df = lf.collect()
+        self.assertEqual(6, len(df))
+        self.assertListEqual(['date', 'time'], df._columns)
+        price = view._columns.index('price')
+        self.assertFalse(isinstance(view._values[price], list))
+
+    def test_datetime_literals(self):
+        self.df['date'] = self.df.date.apply(str_to_dt)
+        lf = self.df.lazy()
+        lf = lf[(lf.date >= '2019-01-05') & ('2019-01-06' > lf.date)]
+        df = lf.collect()
+        self.assertEqual(12, len(df))
+        self.assertEqual('datetime', df.date.dtype)
+        self.assertEqual(dt.datetime(2019, 1, 5), df.date[0])
+
+    def test_unknown_column(self):
+        lf = self.df.lazy()[['tick']]
+        lf = lf[lf.price > 1]
+        try:
+            lf.collect()
+            self.fail('Should have raised a ValueError')
+        except ValueError:
+            pass
+
+
+class TestCSV(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def write(self, text):
+        path = os.path.join(self.tmp, 'data.csv')
+        with open(path, 'w') as f:
+            f.write(text)
+        return path
+
+    def test_read_csv(self):
+        path = self.write('tick,date,price,qty,note\n'
+                          'aapl,2019-01-01,100.5,10,a\n'
+                          '\n'
+                          'goog,2019-01-02,123,20,\n'
+                          'msft,2019-01-03,45.67,30,c\n')
+        df = read_csv(path, parse_dates=['date'])
+        self.assertEqual(3, len(df))
+        self.assertListEqual(['tick', 'date', 'price', 'qty', 'note'], df._columns)
+        self.assertEqual('object', df.tick.dtype)
+        self.assertEqual('datetime', df.date.dtype)
+        self.assertEqual('float64', df.price.dtype)
+        self.assertEqual('int64', df.qty.dtype)
+        self.assertListEqual(['a', '', 'c'], list(df.note))
+        self.assertEqual(dt.datetime(2019, 1, 2), df.date[1])
+        self.assertListEqual([10, 20, 30], list(df.qty))
+
+    def test_dtypes(self):
+        path = self.write('a,b,c,d,e\n1,2,true,2019-01-01,x\n3,4,0,2019-01-02,y\n')
+        df = read_csv(path, dtypes={'a': 'object', 'b': 'float64', 'c': 'bool', 'd': 'datetime', 'e': str.upper})
+        self.assertListEqual(['1', '3'], list(df.a))
+        self.assertEqual('float64', df.b.dtype)
+        self.assertListEqual([True, False], list(df.c))
+        self.assertEqual('datetime', df.d.dtype)
+        self.assertListEqual(['X', 'Y'], list(df.e))
+        df = read_csv(path, dtypes={'e': 'category'})
+        self.assertEqual('category', df.e.dtype)
+        self.assertListEqual([False, True], list(df.e == 'y'))
+        try:
+            read_csv(path, dtypes={'a': 'decimal'})
+            self.fail('Should have raised a ValueError')
+        except ValueError:
+            pass
+
+    def test_iter_csv(self):
+        path = self.write('a,b\n' + ''.join('{},{}\n'.format(i, i * 0.5) for i in range(10)))
+        chunks = list(iter_csv(path, chunksize=4))
+        self.assertListEqual([4, 4, 2], [len(chunk) for chunk in chunks])
+        self.assertListEqual([8, 9], list(chunks[-1].a))
+        self.assertListEqual(['float64']*3, [chunk.b.dtype for chunk in chunks])
+        self.assertListEqual(['int64']*3, [chunk.a.dtype for chunk in chunks])
+        self.assertListEqual([4, 4, 2], [len(chunk) for chunk in read_csv(path, chunksize=4)])
+        with open(path) as f:
+            self.assertEqual(10, len(read_csv(f)))
+
+    def test_iter_csv_schema(self):
+        # Every chunk gets the dtypes of the ones before it, blanks are missing floats
+        path = self.write('a,b\nx,2.5\ny,\nz,4\n')
+        chunks = list(iter_csv(path, chunksize=1))
+        self.assertListEqual(['float64']*3, [chunk.b.dtype for chunk in chunks])
+        self.assertListEqual([[True], [False], [True]], [list(chunk.b > 1) for chunk in chunks])
+        self.assertListEqual([4.0], list(chunks[2].b))
+        path = self.write('a\n1\nx\n')
+        self.assertRaises(ValueError, list, iter_csv(path, chunksize=1))
+        self.assertEqual('object', read_csv(path).a.dtype)
+        path = self.write('a,b\n1,x\n,y\n1.5,z\n2,w\n')
+        chunks = list(iter_csv(path, chunksize=1))
+        self.assertListEqual(['int64', 'float64', 'float64', 'float64'], [chunk.a.dtype for chunk in chunks])
+        self.assertTrue(math.isnan(chunks[1].a[0]))
+        self.assertListEqual([1.5, 2.0], [chunks[2].a[0], chunks[3].a[0]])
+        self.assertEqual('float64', read_csv(path).a.dtype)
+        self.assertRaises(ValueError, iter_csv, path, chunksize=0)
+        self.assertRaises(ValueError, read_csv, path, chunksize=-1)
+
+    def test_strict_numbers(self):
+        df = read_csv(self.write('id,x,y,z\n1_0,nan,1e3,-2\n2_0,inf,.5,+3\n'))
+        self.assertListEqual(['1_0', '2_0'], list(df.id))
+        self.assertListEqual(['nan', 'inf'], list(df.x))
+        self.assertListEqual([1000.0, 0.5], list(df.y))
+        self.assertListEqual([-2, 3], list(df.z))
+
+    def test_short_and_empty(self):
+        df = read_csv(self.write('a,b\n'))
+        self.assertEqual(0, len(df))
+        self.assertListEqual(['a', 'b'], df._columns)
+        self.assertListEqual([], list(iter_csv(self.write('a,b\n'))))
+        self.assertEqual(0, len(read_csv(self.write(''))))
+        df = read_csv(self.write('a,b\n1\n2,3\n'))
+        self.assertEqual('float64', df.b.dtype)
+        self.assertTrue(math.isnan(df.b[0]))
+        self.assertEqual(3.0, df.b[1])
+        try:
+            read_csv(self.write('a,b\n1,2,3\n'))
+            self.fail('Should have raised a ValueError')
+        except ValueError:
+            pass
+
+
+
+class TestSnapshot(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp, 'frame.mf')
+        self.df = DataFrame.from_rows([
+            ('aapl', 1, 1.5, True, dt.datetime(2019, 1, 1), 'eu'),
+            (None, 2, 2.5, False, dt.datetime(2019, 1, 2, 12), 'us'),
+            ('goog', 3, 3.5, True, dt.datetime(2019, 1, 3), None),
+        ], ['tick', 'qty', 'price', 'flag', 'date', 'region'])
+        self.df['region'] = self.df.region.astype('category')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_round_trip(self):
+        self.df.save(self.path)
+        for mmap in (True, False):
+            df = load(self.path, mmap=mmap)
+            self.assertEqual(self.df.to_dict(), df.to_dict())
+            self.assertListEqual(self.df._dtypes, df._dtypes)
+            self.assertListEqual(self.df._columns, df._columns)
+
+    def test_pickled_objects(self):
+        # Unpickling can run code from the file, both sides have to opt in
+        self.df['other'] = Series([None, (1, 2), 'x'])
+        self.assertRaises(ValueError, self.df.save, self.path)
+        self.assertFalse(os.path.exists(self.path))
+        self.df.save(self.path, allow_pickle=True)
+        self.assertRaises(ValueError, load, self.path)
+        for mmap in (True, False):
+            df = load(self.path, mmap=mmap, allow_pickle=True)
+            self.assertListEqual([None, (1, 2), 'x'], list(df.other))
+            self.assertEqual(self.df.to_dict(), df.to_dict())
+
+    def test_save_over_loaded(self):
+        # The loaded frame's columns still map the file being replaced
+        self.df.save(self.path)
+        df = load(self.path)
+        other = load(self.path)
+        df.set('all', 'extra', 1)
+        df.save(self.path)
+        self.assertEqual(other.qty.tolist(), [1, 2, 3])
+        self.assertEqual(load(self.path).to_dict(), df.to_dict())
+        self.assertEqual(os.listdir(self.tmp), ['frame.mf'])
+
+    def test_lazy_columns(self):
+        self.df.set_index('tick')
+        self.df.save(self.path)
+        df = load(self.path)
+        self.assertListEqual([2], list(df.loc[None].qty))
+        self.assertEqual(3, len(df))
+        df.drop(df.qty == 2)
+        self.assertListEqual([1.5, 3.5], list(df.price))
+        df.set('all', 'flag', False)
+        self.assertListEqual([False, False], list(df.flag))
+        self.assertListEqual([True, False, True], list(load(self.path).flag))
+        self.assertListEqual(['eu', None], list(load(self.path).view([True, False, True]).region))
+
+    def test_empty(self):
+        DataFrame.from_rows([], ['a']).save(self.path)
+        self.assertEqual(0, len(load(self.path)))
+        self.assertListEqual(['a'], load(self.path)._columns)
+
+    def test_not_a_snapshot(self):
+        with open(self.path, 'wb') as f:
+            f.write(b'tick,qty\n')
+        self.assertRaises(ValueError, load, self.path)
+
+
+class TestRolling(unittest.TestCase):
+    def setUp(self):
+        self.s = Series([1, 3, None, 2, 5, 4])
+
+    def test_fixed(self):
+        self.assertEqual(self.s.rolling(2).sum().tolist(), [None, 4, None, None, 7, 9])
+        self.assertEqual(self.s.rolling(3, min_periods=1).max().tolist(), [1, 3, 3, 3, 5, 5])
+        self.assertEqual(self.s.rolling(3, min_periods=2).min().tolist(), [None, 1, 1, 2, 2, 2])
+        self.assertEqual(self.s.rolling(2, min_periods=1).mean().tolist(), [1.0, 2.0, 3.0, 2.0, 3.5, 4.5])
+        self.assertEqual(Series([1.5, 2.5, 3.5]).rolling(2).sum().dtype, 'object')
+        self.assertRaises(ValueError, self.s.rolling, 0)
+
+    def test_std(self):
+        std = Series([2.0, 4.0, 4.0, 4.0, 5.0, 5.0, 7.0, 9.0]).rolling(4).std().tolist()
+        self.assertEqual(std[:3], [None]*3)
+        for value, expected in zip(std[3:], [1.0, 0.5, 0.5773502691896, 1.2583057392118, 1.9148542155127]):
+            self.assertAlmostEqual(value, expected)
+
+    def test_cancellation(self):
+        # A large value leaving the window mustn't take the small ones with it
+        s = Series([1e16, 0.1, 0.1, 0.1, 0.1])
+        self.assertEqual([None, 1e16, 0.2, 0.2, 0.2], s.rolling(2).sum().tolist())
+        self.assertEqual([None, 5e15, 0.1, 0.1, 0.1], s.rolling(2).mean().tolist())
+        self.assertEqual([None, 3, 5], Series([1, 2, 3]).rolling(2).sum().tolist())
+
+    def test_expanding(self):
+        self.assertEqual(self.s.expanding().sum().tolist(), [1, 4, 4, 6, 11, 15])
+        self.assertEqual(self.s.expanding(min_periods=3).max().tolist(), [None, None, None, 3, 5, 5])
+        self.assertEqual(Series([float('nan'), 2.0]).expanding().min().tolist(), [None, 2.0])
+
+    def test_time_window(self):
+        start = dt.datetime(2019, 1, 1)
+        minutes = [0, 1, 2, 6, 7, 20]
+        on = Series([start + dt.timedelta(minutes=m) for m in minutes])
+        readings = Series([1.0, 2.0, 3.0, 4.0, 5.0, 6.0])
+        self.assertEqual(readings.rolling('5min', on=on).sum().tolist(), [1.0, 3.0, 6.0, 7.0, 9.0, 6.0])
+        self.assertEqual(readings.rolling(dt.timedelta(minutes=5), on=on, min_periods=2).max().tolist(),
+                         [None, 2.0, 3.0, 4.0, 5.0, None])
+        self.assertRaises(ValueError, readings.rolling, '5min')
+        self.assertRaises(ValueError, readings.rolling, '5 fortnights', on=on)
+        self.assertRaises(ValueError, readings.rolling, '5min', on=on[::-1])
+        for window in ('0s', dt.timedelta(0), dt.timedelta(seconds=-5)):
+            self.assertRaises(ValueError, readings.rolling, window, on=on)
+        for window in (2.5, True, [2]):
+            self.assertRaises(ValueError, Series([1, 2]).rolling, window)
+
+
+@unittest.skipIf(pandas is None, 'pandas is not installed')
+class TestPandas(unittest.TestCase):
+    def setUp(self):
+        self.df = DataFrame({
+            'id': [1, 2, 3],
+            'price': [1.5, 2.5, 3.5],
+            'active': [True, False, True],
+            'date': [dt.datetime(2019, 1, 1), dt.datetime(2019, 1, 2, 12), dt.datetime(2019, 1, 3)],
+            'name': ['a', None, 'c'],
+        })
+        self.df.set('all', 'region', Series(['eu', 'us', 'eu']).astype('category'))
+
+    def test_to_pandas(self):
+        pdf = self.df.to_pandas()
+        self.assertEqual(list(pdf.columns), ['id', 'price', 'active', 'date', 'name', 'region'])
+        self.assertEqual([str(d) for d in pdf.dtypes[:4]], ['int64', 'float64', 'bool', 'datetime64[us]'])
+        self.assertEqual(pdf.region.cat.categories.tolist(), ['eu', 'us'])
+        self.assertEqual(pdf.date[1], pandas.Timestamp(2019, 1, 2, 12))
+        self.assertEqual(pdf.id.tolist(), [1, 2, 3])
+
+    def test_from_pandas(self):
+        df = DataFrame.from_pandas(self.df.to_pandas())
+        self.assertEqual(df._dtypes, ['int64', 'float64', 'bool', 'datetime', 'object', 'category'])
+        self.assertEqual(df.to_dict(), self.df.to_dict())
+
+    def test_from_pandas_missing(self):
+        pdf = pandas.DataFrame({
+            'n': pandas.array([1, None], dtype='Int64'),
+            'f': [1.0, float('nan')],
+        })
+        df = DataFrame.from_pandas(pdf)
+        self.assertEqual(df.n.tolist(), [1, None])
+        self.assertEqual(df.f.dtype, 'float64')
+
+    def test_pd_cached(self):
+        pdf = self.df.pd
+        self.assertIs(self.df.pd, pdf)
+        self.df.set(self.df.id == 2, 'price', 0.0)
+        self.assertIsNot(self.df.pd, pdf)
+        self.assertEqual(self.df.pd.price.tolist(), [1.5, 0.0, 3.5])
+        self.df.drop(self.df.id == 1)
+        self.assertEqual(self.df.pd.id.tolist(), [2, 3])
+        self.assertEqual(len(self.df.copy().pd), 2)
+
+
+@unittest.skipIf(numpy is None, 'numpy is not installed')
+class TestBackend(unittest.TestCase):
+    # The numpy kernels have to give exactly what the Python loops give
+    def setUp(self):
+        self.name = mframe.backend.name
+
+    def tearDown(self):
+        mframe.backend.use(self.name)
+
+    def assertSame(self, fn):
+        results = []
+        for name in ('python', 'numpy'):
+            mframe.backend.use(name)
+            try:
+                result = fn()
+            except ZeroDivisionError as e:
+                result = type(e)
+            if isinstance(result, Series):
+                result = (result.dtype, repr(result.tolist()))
+            results.append(result)
+        self.assertEqual(results[0], results[1])
+        return results[1]
+
+    def test_environment(self):
+        previous, numpy = os.environ.get('MFRAME_BACKEND'), mframe.numpy
+        try:
+            with warnings.catch_warnings(record=True) as caught:
+                warnings.simplefilter('always')
+                os.environ['MFRAME_BACKEND'] = 'fortran'
+                self.assertEqual('python', mframe._Backend().name)
+                os.environ['MFRAME_BACKEND'] = 'numpy'
+                mframe.numpy = None
+                self.assertEqual('python', mframe._Backend().name)
+            self.assertEqual(2, len(caught))
+            self.assertRaises(ValueError, mframe.backend.use, 'fortran')
+            self.assertRaises(ImportError, mframe.backend.use, 'numpy')
+        finally:
+            mframe.numpy = numpy
+            if previous is None:
+                del os.environ['MFRAME_BACKEND']
+            else:
+                os.environ['MFRAME_BACKEND'] = previous
+
+    def test_arithmetic(self):
+        ints, floats = Series([3, -2, 7]), Series([0.5, -0.0, 2.25])
+        self.assertEqual(self.assertSame(lambda: ints * 2 + floats), ('float64', '[6.5, -4.0, 16.25]'))
+        self.assertSame(lambda: 10 - ints)
+        self.assertSame(lambda: ints / 2)
+        self.assertSame(lambda: 1 / floats)
+        self.assertSame(lambda: ints + Series([1, 2]))
+        self.assertEqual(self.assertSame(lambda: Series([True, True]) + Series([True, False])), ('int64', '[2, 1]'))
+
+    def test_arithmetic_exact(self):
+        big = Series([2**62, -1])
+        self.assertEqual(self.assertSame(lambda: big * 4), ('object', repr([2**64, -4])))
+        self.assertSame(lambda: big + big)
+        self.assertSame(lambda: Series([2**60 + 1]) / 3)
+        self.assertSame(lambda: Series([1.5]) + 2**62 + 1)
+
+    def test_compare(self):
+        ints, floats = Series([1, 2, 2**60 + 1]), Series([float('nan'), 1.0, -2.5])
+        self.assertSame(lambda: (ints > 1.5).tolist())
+        self.assertSame(lambda: (ints == float(2**60)).tolist())
+        self.assertSame(lambda: (floats != 1).tolist())
+        self.assertSame(lambda: (floats < 2**60 + 1).tolist())
+        self.assertSame(lambda: (Series([True, False]) == 1).tolist())
+        dates = Series([dt.datetime(2019, 1, 1), dt.datetime(2019, 1, 3)])
+        self.assertEqual(self.assertSame(lambda: (dates >= '2019-01-02').tolist()), [False, True])
+
+    def test_abs_round(self):
+        self.assertSame(lambda: abs(Series([-2**63, 5])))
+        self.assertSame(lambda: abs(Series([-1.5, -0.0])))
+        self.assertSame(lambda: round(Series([0.5, 1.5, 2.5, -0.5]), 0))
+        self.assertSame(lambda: round(Series([2.675, 0.285]), 2))
+        self.assertSame(lambda: round(Series([15, 25]), -1))
+
+    def test_reduce(self):
+        self.assertSame(lambda: repr(Series([0.0, -0.0, 1.0]).min()))
+        self.assertSame(lambda: repr(Series([3.0, float('nan'), 1.0]).max()))
+        self.assertSame(lambda: Series([True, False]).min())
+        self.assertEqual(self.assertSame(lambda: Series([4, 9, 9, 1]).max()), 9)
+
+    def test_use(self):
+        mframe.backend.use('python')
+        self.assertEqual(mframe.backend.name, 'python')
+        mframe.backend.use()
+        self.assertEqual(mframe.backend.name, 'numpy')
+        self.assertRaises(ValueError, mframe.backend.use, 'gpu')
+
 
 if __name__ == '__main__':
     unittest.main()